@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the analysis engine, on synthetic input and on the bundled
+notation/ and audio/ files.
+
+Each benchmark times single calls and reports latency percentiles (in
+microseconds) and, where a call covers frames of music, frames per second.
+Benchmarks whose libraries are missing (music21, librosa, scipy) are
+reported as skipped.
+
+    python benchmarks/bench_analysis.py                         # run and print
+    python benchmarks/bench_analysis.py --save baseline.json    # store a baseline
+    python benchmarks/bench_analysis.py --compare baseline.json # flag regressions (exit 1)
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import pt_utils
+import pt_keypattern
+import pt_kpdve_list_optimize
+import partita
+
+
+# =============================================================================
+# TIMING
+# =============================================================================
+
+def summarize(latencies, frames=None):
+    latencies = np.asarray(latencies, dtype=float)
+    total = float(latencies.sum())
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e6
+
+    summary = {"calls": len(latencies), "p50_us": p50, "p90_us": p90, "p99_us": p99,
+               "max_us": float(latencies.max() * 1e6), "total_s": total}
+    if frames is not None:
+        summary["frames"] = int(frames)
+        summary["frames_per_s"] = frames / total if total > 0 else float("inf")
+
+    return summary
+
+
+def timed(function, arguments, warmup=10):
+    '''
+    the results and the per-call latencies of function over arguments
+    (after an untimed pass over the first few, so lazy tables and caches are warm)
+    '''
+
+    for args in arguments[:warmup]:
+        function(*args)
+
+    results = []
+    latencies = np.zeros(len(arguments))
+    for i, args in enumerate(arguments):
+        start = time.perf_counter()
+        results.append(function(*args))
+        latencies[i] = time.perf_counter() - start
+
+    return results, latencies
+
+
+# =============================================================================
+# BENCHMARKS: each returns a summary dict (or raises skip)
+# =============================================================================
+
+class skip(Exception):
+    pass
+
+
+def requires(module_name):
+    try:
+        return __import__(module_name)
+    except ImportError as e:
+        raise skip(f"needs {module_name} ({e})")
+
+
+def bench_candidate_table_build(rng):
+    '''building the notegroup -> KPDVE candidate tables from nothing (v_opt 0)'''
+
+    def build():
+        pt_keypattern._KPDVE_CANDIDATE_TABLES.clear()
+        partita._CHROMATIC_CANDIDATE_TABLES.clear()
+        return partita.chromatic_candidate_table(0)
+
+    _, latencies = timed(build, [()] * 3, warmup=0)
+    return summarize(latencies)
+
+
+def make_bench_candidates(v_opt):
+    def bench(rng):
+        '''analyze_binary_note_input over all 4096 notegroups'''
+        partita.chromatic_candidate_table(v_opt)  # warm
+        _, latencies = timed(partita.analyze_binary_note_input, [(ng, v_opt) for ng in range(pt_utils.CHROMATIC_SCALE + 1)])
+        return summarize(latencies, frames=len(latencies))
+
+    bench.__doc__ = f"analyze_binary_note_input over all 4096 notegroups, v_opt {v_opt}"
+    return bench
+
+
+def realistic_notegroups(rng, n):
+    # chords that exist, with a note added or removed now and then (as in audio frames)
+    kpdve_a = np.column_stack([rng.integers(0, m, n) for m in pt_utils.MODVALS])
+    chords = partita.chord_for_KPDVE_array(kpdve_a)
+    noise = np.where(rng.random(n) < 0.3, 1 << rng.integers(0, 12, n), 0)
+
+    return chords ^ noise
+
+
+def bench_closest_kpdve(rng):
+    '''closest_kpdve on the candidate lists of realistic chords'''
+
+    notegroups = realistic_notegroups(rng, 5000)
+    lists = [partita.analyze_binary_note_input(int(ng)) for ng in notegroups]
+    landmarks = np.column_stack([rng.integers(0, m, len(lists)) for m in pt_utils.MODVALS])
+
+    _, latencies = timed(pt_kpdve_list_optimize.closest_kpdve, list(zip(lists, landmarks)))
+    return summarize(latencies, frames=len(latencies))
+
+
+def bench_change_notegroup(rng):
+    '''harmony_state.change_notegroup over a sequence of realistic chords, with runs'''
+
+    harmony_state = requires("harmony_state")
+
+    notegroups = np.repeat(realistic_notegroups(rng, 5000), rng.integers(1, 4, 5000)).tolist()
+    state = harmony_state.harmony_state()
+
+    _, latencies = timed(state.change_notegroup, [(ng,) for ng in notegroups])
+    return summarize(latencies, frames=len(latencies))
+
+
+def bench_analyze_notegroup_list(rng):
+    '''partita.analyze_notegroup_list (greedy, run-length collapsed) on 20000 frames'''
+
+    notegroups = np.repeat(realistic_notegroups(rng, 5000), rng.integers(1, 8, 5000))[:20000]
+
+    _, latencies = timed(partita.analyze_notegroup_list, [(notegroups, np.array([0, 0, 0, 4, 2]))] * 3, warmup=1)
+    return summarize(latencies, frames=len(notegroups) * len(latencies))
+
+
+def bench_notation_files(rng):
+    '''pt_analyzeMIDI.analyze_notation_file on notation/*.mid'''
+
+    requires("music21")
+    import pt_analyzeMIDI
+
+    files = sorted(glob.glob(os.path.join(ROOT, "notation", "*.mid")))
+    if not files:
+        raise skip("no notation/*.mid")
+
+    results, latencies = timed(pt_analyzeMIDI.analyze_notation_file, [(f,) for f in files], warmup=0)
+    return summarize(latencies, frames=sum(len(bin_a) for bin_a, _ in results))
+
+
+def bench_audio_files(rng):
+    '''pt_analyzeaudio.kpdve_analyze_audiofile on audio/*'''
+
+    requires("librosa")
+    import pt_analyzeaudio
+
+    files = sorted(glob.glob(os.path.join(ROOT, "audio", "*")))
+    if not files:
+        raise skip("no audio/*")
+
+    results, latencies = timed(pt_analyzeaudio.kpdve_analyze_audiofile, [(f,) for f in files], warmup=0)
+    return summarize(latencies, frames=sum(len(bin_a) for bin_a, _ in results))
+
+
+def bench_wavewrite(rng):
+    '''pt_wavewrite.link_wavepile_sequences: 16 chords over 4 seconds (frames are samples)'''
+
+    requires("scipy")
+    import pt_wavewrite
+
+    sequences = [realistic_notegroups(rng, 16) for _ in range(10)]
+    results, latencies = timed(pt_wavewrite.link_wavepile_sequences, [(s, 44100, 4) for s in sequences])
+    return summarize(latencies, frames=sum(len(signal) for signal in results))
+
+
+def bench_live_chroma(rng):
+    '''pt_live_chroma.live_chroma.push, one hop of noise at a time (n_fft 4096, hop 512)'''
+
+    import pt_live_chroma
+
+    engine = pt_live_chroma.live_chroma(sr=22050, n_fft=4096, hop_length=512)
+    hops = rng.standard_normal((2000, 512)).astype(np.float32)
+
+    _, latencies = timed(engine.push, [(hop,) for hop in hops])
+    return summarize(latencies, frames=len(latencies))
+
+
+BENCHMARKS = {"candidate_table_build": bench_candidate_table_build}
+BENCHMARKS.update({f"candidates_v{v}": make_bench_candidates(v) for v in range(len(pt_keypattern.v_options))})
+BENCHMARKS.update({"closest_kpdve": bench_closest_kpdve,
+                   "change_notegroup": bench_change_notegroup,
+                   "analyze_notegroup_list": bench_analyze_notegroup_list,
+                   "notation_files": bench_notation_files,
+                   "audio_files": bench_audio_files,
+                   "wavewrite": bench_wavewrite,
+                   "live_chroma": bench_live_chroma})
+
+
+# =============================================================================
+# RUN, SAVE, COMPARE
+# =============================================================================
+
+def run_benchmarks(names=None, seed=0):
+    results = {}
+    for name, bench in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        try:
+            results[name] = bench(np.random.default_rng(seed))
+        except skip as reason:
+            results[name] = {"skipped": str(reason)}
+
+    return results
+
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "processor": platform.processor(), "system": platform.system(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def compare(results, baseline, threshold=1.25):
+    '''
+    benchmarks whose median latency grew by more than threshold times the baseline
+
+    Returns
+    -------
+    dict
+        name -> (baseline p50, current p50, ratio)
+    '''
+
+    regressions = {}
+    for name, current in results.items():
+        before = baseline.get(name, {})
+        if "p50_us" in current and "p50_us" in before and before["p50_us"] > 0:
+            ratio = current["p50_us"] / before["p50_us"]
+            if ratio > threshold:
+                regressions[name] = (before["p50_us"], current["p50_us"], ratio)
+
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print(f"{'benchmark':24} {'calls':>6} {'p50 us':>10} {'p90 us':>10} {'p99 us':>10} {'frames/s':>12} {'vs base':>8}")
+    for name, r in results.items():
+        if "skipped" in r:
+            print(f"{name:24} skipped: {r['skipped']}")
+            continue
+
+        fps = f"{r['frames_per_s']:12.0f}" if "frames_per_s" in r else " " * 12
+        vs = ""
+        if baseline and "p50_us" in baseline.get(name, {}):
+            vs = f"{r['p50_us'] / baseline[name]['p50_us']:7.2f}x"
+        print(f"{name:24} {r['calls']:6d} {r['p50_us']:10.1f} {r['p90_us']:10.1f} {r['p99_us']:10.1f} {fps} {vs:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark the harmonypartition analysis engine")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--save", metavar="JSON", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="JSON", help="flag regressions against a stored baseline")
+    parser.add_argument("--threshold", type=float, default=1.25, help="median latency ratio that counts as a regression")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.only, args.seed)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+        print(f"baseline written to {args.save}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for name, (before, now, ratio) in regressions.items():
+            print(f"REGRESSION {name}: median {before:.1f} us -> {now:.1f} us ({ratio:.2f}x)")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Check that the streaming audio analysis (kpdve_analyze_audiofile with
+block_length) gives what the in-memory one does, on the bundled audio/ files:
+the same samples, tuning, chroma (to float precision), frame count and analysis,
+without the neighbor filter. With it, the streaming filter only looks within a
+window around each block, so there the share of frames analyzed alike is shown,
+not required.
+
+    python benchmarks/check_streaming_audio.py                  # all of audio/
+    python benchmarks/check_streaming_audio.py --block-length 64 some.wav
+
+Exits 1 if any file differs.
+"""
+
+import os
+import sys
+import glob
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+try:
+    import librosa
+    import pt_analyzeaudio
+except ImportError as e:
+    librosa = None
+    MISSING = e
+
+
+def compare_file(filename, block_length, chroma_tolerance=1e-5):
+    '''
+    Returns
+    -------
+    dict
+        what was compared, and "equal" (True if everything matched)
+    '''
+
+    y, sr = librosa.load(filename)
+    y_stream = np.concatenate(list(pt_analyzeaudio.iter_audio_samples(filename, sr)))
+    same_samples = len(y) == len(y_stream) and np.array_equal(y, y_stream)
+
+    S = np.abs(librosa.stft(y)) ** 2
+    tuning = librosa.estimate_tuning(S=S, sr=sr, bins_per_octave=12)
+    tuning_stream = pt_analyzeaudio.estimate_audiofile_tuning(filename, sr, block_length)
+
+    chroma_a = librosa.feature.chroma_stft(S=S, sr=sr, tuning=tuning)
+    chroma_stream = np.hstack(list(pt_analyzeaudio.iter_chroma_audiofile(filename, block_length, sr, filter_chroma=False)))
+    chroma_diff = float(np.max(np.abs(chroma_a - chroma_stream))) if chroma_a.shape == chroma_stream.shape else float("inf")
+
+    bin_a, kpdve_a = pt_analyzeaudio.kpdve_analyze_audiofile(filename, filter_chroma=False)
+    bin_stream, kpdve_stream = pt_analyzeaudio.kpdve_analyze_audiofile(filename, filter_chroma=False, block_length=block_length)
+    same_analysis = np.array_equal(bin_a, bin_stream) and np.array_equal(kpdve_a, kpdve_stream)
+
+    _, kpdve_f = pt_analyzeaudio.kpdve_analyze_audiofile(filename)
+    _, kpdve_f_stream = pt_analyzeaudio.kpdve_analyze_audiofile(filename, block_length=block_length)
+    filtered_alike = float(np.mean(np.all(kpdve_f == kpdve_f_stream, axis=1))) if len(kpdve_f) == len(kpdve_f_stream) else 0.0
+
+    return {"samples": same_samples, "tuning": (tuning, tuning_stream), "chroma_diff": chroma_diff,
+            "frames": (len(bin_a), len(bin_stream)), "analysis": same_analysis, "filtered_alike": filtered_alike,
+            "equal": bool(same_samples and tuning == tuning_stream and chroma_diff <= chroma_tolerance and same_analysis)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="compare streaming and in-memory audio analysis")
+    parser.add_argument("files", nargs="*", help="audio files (default: audio/*)")
+    parser.add_argument("--block-length", type=int, default=300, help="frames per block (small: many block edges)")
+    args = parser.parse_args()
+
+    if librosa is None:
+        print(f"skipped: needs librosa ({MISSING})")
+        sys.exit(0)
+
+    files = args.files or sorted(glob.glob(os.path.join(ROOT, "audio", "*")))
+
+    differing = 0
+    for filename in files:
+        r = compare_file(filename, args.block_length)
+        differing += not r["equal"]
+        print(f"{'ok  ' if r['equal'] else 'DIFF'} {os.path.basename(filename):32} samples {r['samples']!s:5} "
+              f"tuning {r['tuning'][0]:+.2f}/{r['tuning'][1]:+.2f} chroma {r['chroma_diff']:.1e} "
+              f"frames {r['frames'][0]}/{r['frames'][1]} analysis {r['analysis']} filtered alike {r['filtered_alike']:.0%}")
+
+    sys.exit(1 if differing else 0)
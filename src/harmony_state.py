@@ -13,29 +13,48 @@ import pt_utils
 import pt_musicutils
 import pt_naming_conventions
 import pt_keypattern
-import pt_analyzeaudio
 
 #   IMPORTANT: IT MAY BE BEST IN THE END TO DIG ONE LEVEL DEEPER, AND HAVE THE WHOLE THING DEFINED BY THE BITWISE ENCODING
 #   THIS WILL ALLOW ONE OF THE EXTRA BITS (CURRENTLY IT USES 28) TO ENCODE THE PENTATONIC/HEPTATONIC BASE.
 #   PENTATONIC REMAINS INSUFFICIENTLY EXPLORED
 
+# python lists for the per-event path (see pt_musicutils, pt_keypattern)
+_CHORDS_FOR_ENCODING = pt_musicutils.CHROM_KPDVE_NOTES[:, pt_musicutils.CHORD_COL].tolist()
+_KP_MASKS = pt_keypattern.KP_MASKS.tolist()
+
+
+def _encode_kpdve(kpdve):
+    k, p, d, v, e = (int(x) for x in kpdve)
+    if not (0 <= k < 16 and 0 <= p < 8 and 0 <= d < 8 and 0 <= v < 8 and 0 <= e < 8):
+        raise ValueError(f"kpdve {kpdve} does not fit the 16-bit encoding")
+
+    return (k << 12) | (p << 9) | (d << 6) | (v << 3) | e
+
+
 class harmony_state():
     '''
     The core class for improvised performing in the kpdve|binary scheme
+
+    The KPDVE is held as its 16-bit encoding (pt_utils.KPDVE_to_binary_encoding)
+    and the chord as a 12-bit int; current_kpdve and prev_kpdve are read-only
+    rows of pt_utils.KPDVE_DECODE, made on demand.
     '''
 
-    def __init__(self, start_kpdve=np.array([0, 0, 0, 4, 3])):
+    __slots__ = ('start_kpdve', 'current_encoding', 'current_binary', 'prev_encoding', 'prev_binary', 
+                 'valid_state', 'chroma_values', 'rand_walk_steps', 'transitions')
+
+    def __init__(self, start_kpdve=np.array([0, 0, 0, 4, 3]), transitions=None):
         # KPDVE VAL & START (START DOES *NOT* CHANGE)
         self.start_kpdve = start_kpdve # THIS NEVER CHANGES -- IT MAY TURN OUT TO BE USEFUL FOR ORIENTING TOWARD A TONALITY... SEEKING 'HOME'
 
-        # KPDVE (5-param Key, Pattern, Degree, Voicing, Extensions)
-        self.current_kpdve = start_kpdve
+        # KPDVE (5-param Key, Pattern, Degree, Voicing, Extensions), encoded
+        self.current_encoding = _encode_kpdve(start_kpdve)
 
         # BINARY (chromatic)
-        self.current_binary = partita.chord_for_KPDVE_input(self.current_kpdve)
+        self.current_binary = partita.chord_for_KPDVE_input(start_kpdve)
 
         # PREVIOUS VALUES -- THES REMAIN UNUSED...
-        self.prev_kpdve = self.current_kpdve
+        self.prev_encoding = self.current_encoding
         self.prev_binary = self.current_binary
 
         #FLAG INVALID STATE
@@ -46,6 +65,26 @@ class harmony_state():
 
         self.rand_walk_steps = np.array([-1, 0, 1])
 
+        # ENGINE: None searches every step, a pt_transitiontable.transition_table looks it up
+        self.transitions = transitions
+
+
+    @property
+    def current_kpdve(self):
+        return pt_utils.KPDVE_DECODE[self.current_encoding]
+
+    @current_kpdve.setter
+    def current_kpdve(self, kpdve):
+        self.current_encoding = _encode_kpdve(kpdve)
+
+    @property
+    def prev_kpdve(self):
+        return pt_utils.KPDVE_DECODE[self.prev_encoding]
+
+    @prev_kpdve.setter
+    def prev_kpdve(self, kpdve):
+        self.prev_encoding = _encode_kpdve(kpdve)
+
 
 #   CORE FUNCTIONS: CHANGE BY KPDVE OR BINARY
     def change_kpdve(self, new_kdpve):
@@ -63,11 +102,12 @@ class harmony_state():
 
         '''
 
-        if (np.array_equal(self.current_kpdve, new_kdpve)):
+        encoding = _encode_kpdve(new_kdpve)
+        if encoding == self.current_encoding:
             return False
         
-        self.current_kpdve = new_kdpve
-        self.current_binary = partita.chord_for_KPDVE_input(self.current_kpdve)
+        self.current_encoding = encoding
+        self.current_binary = _CHORDS_FOR_ENCODING[encoding] or partita.chord_for_KPDVE_input(new_kdpve)
         
         return True
 
@@ -80,11 +120,25 @@ class harmony_state():
         ----------
         notegroup : int
             a chromatic pitch-class set.
+        v_opt : int (index)
+            selects from voicing options in keypattern.py. The transition table
+            is only read if it was built for this v_opt; otherwise the step is
+            searched (with the table's weights).
 
         Returns
         -------
         True if changed, False if no change is NECESSARY
 
+        a table that has no analysis for anything, built for v_opt 0
+        >>> import pt_transitiontable
+        >>> nothing = np.broadcast_to(np.uint16(pt_transitiontable.INVALID_ENTRY), (4096, pt_transitiontable.PDVE_COUNT))
+        >>> state = harmony_state(transitions=pt_transitiontable.transition_table(nothing, v_opt=0))
+        >>> state.change_notegroup(0b000010010001)
+        False
+        >>> state.change_notegroup(0b000010010001, v_opt=1)
+        True
+        >>> state.current_kpdve.tolist() == partita.analyze_binary_input_for_closest_KPDVE(0b000010010001, np.array([0, 0, 0, 4, 3]), v_opt=1).tolist()
+        True
         '''
 
         # BIG QUESTION: SHOULD THIS STAY IN THE SAME CHORD IF THE or OPERATIONS ALLOWS?
@@ -95,14 +149,19 @@ class harmony_state():
         #     self.current_binary = notegroup
         #     return False
 
-        probe_kpdve = partita.analyze_binary_input_for_closest_KPDVE(notegroup, self.current_kpdve)
-        self.valid_state = (np.array_equal(probe_kpdve, pt_utils.MODVALS) == False)
+        if self.transitions is not None and self.transitions.v_opt == v_opt:
+            probe_encoding = self.transitions.next_encoding(notegroup, self.current_encoding)
+        else:
+            weights = None if self.transitions is None else self.transitions.weights
+            probe_kpdve = partita.analyze_binary_input_for_closest_KPDVE(notegroup, self.current_kpdve, v_opt=v_opt, weights=weights)
+            probe_encoding = int(pt_utils.KPDVE_to_binary_encoding(probe_kpdve))
+        self.valid_state = probe_encoding != pt_utils.MODVALS_ENCODING
 
         if self.valid_state:
-            self.current_kpdve = np.copy(probe_kpdve)
+            self.current_encoding = probe_encoding
             self.current_binary = notegroup
-            ng_fifths = pt_utils.c_chrom_to_f_circle(self.current_binary)
-            ng_kp = pt_keypattern.get_binary_KP(self.current_kpdve[0], self.current_kpdve[1])
+            ng_fifths = pt_utils.c_chrom_to_f_circle(notegroup)
+            ng_kp = _KP_MASKS[(probe_encoding >> 12) * 7 + ((probe_encoding >> 9) & 0b111)]
             if (ng_fifths & ng_kp != ng_fifths):
                 print("mismatch in fifths/kp")
             return True
@@ -146,14 +205,11 @@ class harmony_state():
 
         if max_notes != None:
             # pick top N values
-            top_n = chroma_array.argsort()[::-1][:max_notes]
-            sparse_chroma = np.zeros((12,))
-            for an_idx in top_n:
-                sparse_chroma[an_idx] = chroma_array[an_idx]
-            notegroup = pt_analyzeaudio.chroma_to_binary_value(sparse_chroma, threshold=threshold)
-            self.chroma_values = np.copy(sparse_chroma)
+            sparse_chroma = np.where(pt_utils.top_n_mask(chroma_array, max_notes), chroma_array, 0.0)
+            notegroup = pt_utils.chroma_to_binary_array(sparse_chroma, threshold=threshold)
+            self.chroma_values = sparse_chroma
         else:
-            notegroup = pt_analyzeaudio.chroma_to_binary_value(chroma_array, threshold=threshold)
+            notegroup = pt_utils.chroma_to_binary_array(chroma_array, threshold=threshold)
             self.chroma_values = np.copy(chroma_array)
 
         return self.change_notegroup(notegroup, v_opt=v_opt)
@@ -185,7 +241,7 @@ class harmony_state():
         return pt_utils.bit_locs(pt_musicutils.chrom_conv_tonic_for_KPDVE(self.current_kpdve))[0]
 
     def current_minimal_rep(self):
-        return pt_utils.minimal_bin_kpdve(self.current_binary, self.current_kpdve)
+        return (self.current_encoding << 12) | self.current_binary
 
     def current_kpdve_list(self):
         return partita.analyze_binary_note_input(self.current_binary)
@@ -338,7 +394,7 @@ class harmony_state():
 
         Returns
         -------
-        None
+        True if the state changed
 
         >>> param_increment(2, increment=2)
         array([0, 0, 2, 0, 0])
@@ -353,7 +409,7 @@ class harmony_state():
         inc_kpdve = np.zeros(5, dtype=int)
         inc_kpdve[param_num % 5] = increment
 
-        self.change_kpdve(pt_utils.kpdve_add(self.current_kpdve, inc_kpdve))
+        return self.change_kpdve(pt_utils.kpdve_add(self.current_kpdve, inc_kpdve))
 
     def random_friendly_kpdve(self):
         a_kpdve = pt_utils.kpdve_random()
@@ -363,7 +419,12 @@ class harmony_state():
         self.change_kpdve(a_kpdve)
 
     def random_list_kpdve(self):
-        self.change_kpdve(random.choice(partita.analyze_binary_note_input(self.current_binary)))
+        # another context for the same sounding chord; search only if no KPDVE voices it exactly
+        kpdve_list = partita.KPDVE_list_for_chord(self.current_binary)
+        if len(kpdve_list) == 0:
+            kpdve_list = partita.analyze_binary_note_input(self.current_binary)
+
+        self.change_kpdve(random.choice(kpdve_list))
 
     def random_kpdve(self):
         self.change_kpdve(pt_utils.kpdve_random())
@@ -3,13 +3,14 @@ import numpy as np
 import pt_utils
 import pt_keypattern
 import pt_kpdve_list_optimize
+import pt_musicutils
 
 
 # =============================================================================
 # MIDI and notegroup input for KPDVE output
 # =============================================================================
 
-def analyze_binary_input_for_closest_KPDVE(notegroup, kpdve, v_opt=0):
+def analyze_binary_input_for_closest_KPDVE(notegroup, kpdve, v_opt=0, weights=None):
     '''
 
     Parameters
@@ -18,6 +19,8 @@ def analyze_binary_input_for_closest_KPDVE(notegroup, kpdve, v_opt=0):
         takes a binary-encoded pitch class set (chromatic: 0b10001001001)
     kpdve : np.array(5)
         the previous kpdve result
+    weights : np.array(5), optional
+        distance weights. The default is pt_kpdve_list_optimize.CURRENT_WEIGHTS.
 
     Returns
     -------
@@ -36,7 +39,7 @@ def analyze_binary_input_for_closest_KPDVE(notegroup, kpdve, v_opt=0):
     
     '''
 
-    return pt_kpdve_list_optimize.closest_kpdve(analyze_binary_note_input(notegroup, v_opt=v_opt), kpdve)
+    return pt_kpdve_list_optimize.closest_kpdve(analyze_binary_note_input(notegroup, v_opt=v_opt), kpdve, weights)
 
     # THIS IS VERY PROBLMATIC. WHAT TO DO WITH INVALID ENTRY...
     # if np.array_equal(new_kpdve, pt_utils.MODVALS):
@@ -117,6 +120,295 @@ def analyze_binary_note_input(notegroup, v_opt=0):
     # convert the input to circle of fifths mode and analyze
     return pt_keypattern.get_KPDVE_list_for_notegroup(pt_utils.c_chrom_to_f_circle(notegroup), v_opt=v_opt)
 
+# =============================================================================
+# batch analysis: many notegroups at once, as ragged (offsets, candidates)
+# =============================================================================
+
+_CHROMATIC_CANDIDATE_TABLES = {}
+
+
+def chromatic_candidate_table(v_opt=0):
+    '''
+    the keypattern candidate table re-indexed by chromatic notegroup, so that
+    row n is analyze_binary_note_input(n, v_opt)
+
+    Parameters
+    ----------
+    v_opt : int (index)
+        selects from voicing options in keypattern.py.
+
+    Returns
+    -------
+    offsets : np.array(4097) (int)
+    candidates : np.array(n, 5) (int8)
+        both arrays are read-only
+
+    '''
+
+    v_opt = v_opt % len(pt_keypattern.v_options)
+
+    if v_opt not in _CHROMATIC_CANDIDATE_TABLES:
+        circle_offsets, circle_data = pt_keypattern.KPDVE_candidate_table(v_opt)
+        chrom_to_circle = pt_utils.C_CHROM_TO_F_CIRCLE
+
+        # notegroup 0 has no analysis (see analyze_binary_note_input)
+        offsets, data = pt_utils.ragged_take(circle_offsets, circle_data, chrom_to_circle[1:])
+        offsets = np.concatenate(([0], offsets + 1))
+        data = np.concatenate((np.array([pt_utils.MODVALS], dtype=data.dtype), data))
+
+        offsets.flags.writeable = False
+        data.flags.writeable = False
+        _CHROMATIC_CANDIDATE_TABLES[v_opt] = (offsets, data)
+
+    return _CHROMATIC_CANDIDATE_TABLES[v_opt]
+
+
+def analyze_binary_note_input_batch(notegroups, v_opt=0):
+    '''
+    analyze_binary_note_input for a whole array of chromatic notegroups in one call.
+    the candidates for notegroups[i] are candidates[offsets[i]:offsets[i+1]]
+
+    Parameters
+    ----------
+    notegroups : np.array(n) (int)
+        chromatic pitch class sets (0-4095)
+    v_opt : int (index)
+        selects from voicing options in keypattern.py.
+
+    Returns
+    -------
+    offsets : np.array(n + 1) (int)
+    candidates : np.array(offsets[-1], 5) (int8)
+
+    >>> offsets, candidates = analyze_binary_note_input_batch(np.array([0, 0b100011000100]))
+    >>> offsets
+    array([0, 1, 9])
+    >>> candidates[offsets[1]:offsets[2]]
+    array([[ 0,  0,  0,  4,  3],
+           [ 0,  3,  0,  4,  3],
+           [ 0,  6,  0,  4,  3],
+           [ 1,  6,  6,  4,  3],
+           [10,  1,  2,  4,  3],
+           [11,  0,  1,  4,  3],
+           [11,  1,  1,  4,  3],
+           [11,  4,  1,  4,  3]], dtype=int8)
+
+    >>> analyze_binary_note_input_batch(np.array([1, 4096]))
+    Traceback (most recent call last):
+    ...
+    ValueError: notegroups must be 0-4095 (chromatic pitch class sets): 4096
+
+    '''
+
+    notegroups = np.asarray(notegroups, dtype=int)
+    out_of_range = (notegroups < 0) | (notegroups > pt_utils.CHROMATIC_SCALE)
+    if out_of_range.any():
+        raise ValueError(f"notegroups must be 0-{pt_utils.CHROMATIC_SCALE} (chromatic pitch class sets): {notegroups[out_of_range][0]}")
+
+    offsets, data = chromatic_candidate_table(v_opt)
+    return pt_utils.ragged_take(offsets, data, notegroups)
+
+
+# =============================================================================
+# sequences of notegroups: a kpdve analysis for every frame
+# =============================================================================
+
+def analyze_notegroup_list(notegroups, start_kpdve, v_opt=0, decoder="greedy", return_rle=False):
+    '''
+    analyze a sequence of notegroups (audio frames, score slices...)
+    repeated notegroups are collapsed into runs, each run is analyzed once,
+    and the result is expanded again (unless return_rle is set)
+
+    Parameters
+    ----------
+    notegroups : np.array(n) (int)
+        chromatic pitch class sets
+    start_kpdve : np.array(5)
+        the starting point for harmony analysis
+    v_opt : int (index)
+        selects from voicing options in keypattern.py.
+    decoder : str
+        "greedy": each frame takes the candidate closest to the previous result,
+            as harmony_state.change_notegroup does.
+        "viterbi": the path with the least total weighted distance over the whole sequence.
+    return_rle : bool
+        return the runs instead of one kpdve per notegroup
+
+    Returns
+    -------
+    np.array(n, 5) (int)
+        one kpdve per notegroup. Notegroups without an analysis keep the previous result.
+    or, with return_rle:
+    (starts, lengths, notegroups, kpdve) : np.array(r) x 3 and np.array(r, 5)
+        one entry per run of equal notegroups
+
+    >>> analyze_notegroup_list(np.array([0b100010010001, 0, 0b100010010001]), np.array([0,0,0,4,3]))
+    array([[0, 0, 1, 4, 3],
+           [0, 0, 1, 4, 3],
+           [0, 0, 1, 4, 3]])
+
+    >>> analyze_notegroup_list(np.array([2244, 2244, 2244, 2194]), np.array([0,0,0,4,3]), return_rle=True)
+    (array([0, 3]), array([3, 1]), array([2244, 2194]), array([[0, 0, 0, 4, 3],
+           [0, 6, 1, 4, 3]]))
+    '''
+
+    # a repeated notegroup never changes the analysis (greedy), and a path 
+    # that stays put through a run is never longer (viterbi)
+    starts, lengths, run_notegroups = pt_utils.run_length_encode(np.asarray(notegroups, dtype=int))
+
+    if decoder == "greedy":
+        run_kpdve = greedy_notegroup_analysis(run_notegroups, start_kpdve, v_opt)
+    elif decoder == "viterbi":
+        run_kpdve = viterbi_notegroup_analysis(run_notegroups, start_kpdve, v_opt)
+    else:
+        raise ValueError(f"unknown decoder: {decoder}")
+
+    if return_rle:
+        return starts, lengths, run_notegroups, run_kpdve
+
+    return np.repeat(run_kpdve, lengths, axis=0)
+
+
+def greedy_notegroup_analysis(notegroups, start_kpdve, v_opt=0):
+    '''
+    analyze_notegroup_list with decoder="greedy", frame by frame: each result 
+    is the candidate closest to the one before.
+
+    Parameters
+    ----------
+    notegroups : np.array(n) (int)
+        chromatic pitch class sets
+    start_kpdve : np.array(5)
+        the starting point for harmony analysis
+    v_opt : int (index)
+        selects from voicing options in keypattern.py.
+
+    Returns
+    -------
+    np.array(n, 5) (int)
+
+    '''
+
+    kpdve_a, _, _ = _greedy_steps(notegroups, start_kpdve, chord_for_KPDVE_input(start_kpdve), v_opt)
+
+    return kpdve_a
+
+
+def _greedy_steps(notegroups, current_kpdve, current_binary, v_opt=0):
+    '''
+    the greedy loop from a given state: returns the analysis and the state after it
+    '''
+
+    kpdve_a = np.zeros((len(notegroups), 5), dtype=int)
+
+    # the same steps as harmony_state.change_notegroup
+    for i, ng in enumerate(notegroups):
+        if ng != current_binary:
+            probe_kpdve = analyze_binary_input_for_closest_KPDVE(ng, current_kpdve, v_opt=v_opt)
+            if not np.array_equal(probe_kpdve, pt_utils.MODVALS):
+                current_kpdve = probe_kpdve
+                current_binary = ng
+        kpdve_a[i] = current_kpdve
+
+    return kpdve_a, current_kpdve, current_binary
+
+
+def iter_analyze(notegroups, start_kpdve, v_opt=0, chunk=1024):
+    '''
+    greedy analysis of an unbounded stream of notegroups, chunk by chunk.
+    The state carries over from chunk to chunk, so the results are the same as
+    analyze_notegroup_list on the whole stream; memory stays at one chunk.
+
+    Parameters
+    ----------
+    notegroups : iterable
+        chromatic pitch class sets: ints (audio frames, MIDI slices, a live
+        collector) and/or np.arrays of them (chunks, used as they come)
+    start_kpdve : np.array(5)
+        the starting point for harmony analysis
+    v_opt : int (index)
+        selects from voicing options in keypattern.py.
+    chunk : int
+        how many single notegroups to collect before analyzing them.
+        Arrays are split to this size.
+
+    Yields
+    ------
+    (np.array(m) (int), np.array(m, 5) (int))
+        a chunk of notegroups and its kpdve analysis
+
+    >>> stream = iter_analyze(iter([2244, 2244, 0, 2194]), np.array([0,0,0,4,3]), chunk=2)
+    >>> for ngs, kpdve_a in stream:
+    ...     print(ngs, kpdve_a.tolist())
+    [2244 2244] [[0, 0, 0, 4, 3], [0, 0, 0, 4, 3]]
+    [   0 2194] [[0, 0, 0, 4, 3], [0, 6, 1, 4, 3]]
+    '''
+
+    current_kpdve = start_kpdve
+    current_binary = chord_for_KPDVE_input(start_kpdve)
+
+    def analyze_chunk(chunk_a):
+        nonlocal current_kpdve, current_binary
+        _, lengths, run_notegroups = pt_utils.run_length_encode(chunk_a)
+        run_kpdve, current_kpdve, current_binary = _greedy_steps(run_notegroups, current_kpdve, current_binary, v_opt)
+        return chunk_a, np.repeat(run_kpdve, lengths, axis=0)
+
+    pending = []
+    for item in notegroups:
+        if isinstance(item, np.ndarray) and item.ndim > 0:
+            if pending:
+                yield analyze_chunk(np.array(pending, dtype=int))
+                pending = []
+            item = item.astype(int).reshape(-1)
+            for i in range(0, len(item), chunk):
+                yield analyze_chunk(item[i:i + chunk])
+        else:
+            pending.append(int(item))
+            if len(pending) >= chunk:
+                yield analyze_chunk(np.array(pending, dtype=int))
+                pending = []
+
+    if pending:
+        yield analyze_chunk(np.array(pending, dtype=int))
+
+
+def viterbi_notegroup_analysis(notegroups, start_kpdve, v_opt=0):
+    '''
+    analyze_notegroup_list with decoder="viterbi": the least total weighted 
+    distance (pt_kpdve_list_optimize.CURRENT_WEIGHTS) through all frames that 
+    have an analysis. Frames without one keep the previous result.
+
+    Parameters
+    ----------
+    notegroups : np.array(n) (int)
+        chromatic pitch class sets
+    start_kpdve : np.array(5)
+        the starting point for harmony analysis
+    v_opt : int (index)
+        selects from voicing options in keypattern.py.
+
+    Returns
+    -------
+    np.array(n, 5) (int)
+
+    '''
+
+    notegroups = np.asarray(notegroups, dtype=int)
+    offsets, candidates = analyze_binary_note_input_batch(notegroups, v_opt)
+
+    # no analysis: a single MODVALS row
+    valid = candidates[offsets[:-1], 0] != pt_utils.MODVALS[0]
+    valid_offsets, valid_candidates = pt_utils.ragged_take(offsets, candidates, np.flatnonzero(valid))
+
+    path = pt_kpdve_list_optimize.viterbi_kpdve_path(valid_offsets, valid_candidates, start_kpdve)
+
+    # hold the last valid result (or the start) through invalid frames
+    last_valid = np.cumsum(valid) - 1
+    held = np.vstack((path, np.asarray(start_kpdve, dtype=int)[np.newaxis, :]))
+
+    return held[last_valid]
+
+
 # =============================================================================
 # get a notegroup for a kpdve value
 # =============================================================================
@@ -145,8 +437,62 @@ def chord_for_KPDVE_input(a_kpdve):
  
     '''
 
+    i = pt_musicutils.KPDVE_table_index(a_kpdve)
+    if i >= 0:
+        return pt_musicutils._CHROM_KPDVE_NOTES_LIST[i][pt_musicutils.CHORD_COL]
+
     return pt_utils.f_circle_to_c_chrom(pt_keypattern.get_binary_KPDVE_chord(a_kpdve))
 
+
+def chord_for_KPDVE_array(kpdve_a):
+    '''
+    chord_for_KPDVE_input for a whole analysis (read from pt_musicutils.CHROM_KPDVE_NOTES)
+
+    Parameters
+    ----------
+    kpdve_a : np.array(n, 5)
+        kpdve values
+
+    Returns
+    -------
+    np.array(n) (int)
+        chromatic chords (0 for values outside the KPDVE space)
+
+    >>> chord_for_KPDVE_array(np.array([[0,0,0,4,3], [11,0,2,4,3]]))
+    array([2244, 2194])
+    '''
+
+    return pt_musicutils.KPDVE_notes_array(kpdve_a, pt_musicutils.CHORD_COL, chromatic=True)
+
+
+def KPDVE_list_for_chord(notegroup):
+    '''
+    every KPDVE whose chord is exactly notegroup: the reverse of chord_for_KPDVE_input,
+    read from pt_musicutils.VOICING_ENCODINGS (no analysis)
+
+    Parameters
+    ----------
+    notegroup : int
+        a chromatic pitch class set
+
+    Returns
+    -------
+    np.array(n, 5) (int)
+        in ascending encoded order. Empty if no KPDVE voices the notegroup.
+
+    F Major 7
+    >>> KPDVE_list_for_chord(0b100011000100)[:4]
+    array([[0, 0, 0, 4, 3],
+           [0, 0, 5, 3, 3],
+           [0, 3, 0, 4, 3],
+           [0, 3, 5, 3, 3]])
+
+    >>> KPDVE_list_for_chord(0b111111111111)
+    array([], shape=(0, 5), dtype=int64)
+    '''
+
+    return pt_utils.binary_encoding_to_KPDVE_array(pt_musicutils.KPDVE_encodings_for_chord(notegroup))
+
 # =============================================================================
 # # # =============================================================================
 # # #  Maximal optimized in/out -- probably more effective is to put this in the reader...
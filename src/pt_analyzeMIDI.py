@@ -10,12 +10,12 @@ import music21
 import numpy as np
 
 import pt_utils
-import harmony_state
+import partita
 
 # BARE=BONES integration with music 21
 
 # =============================
-def analyze_parsed_notation_file(parsedfile, key_orientation=np.array([0,0,0,4,2]), beats_per_slice=0.25):
+def analyze_parsed_notation_file(parsedfile, key_orientation=np.array([0,0,0,4,2]), beats_per_slice=0.25, decoder="greedy", return_rle=False):
     '''
     Analyze an xml or midi file, and send back a tuple of bin_analysis, kpdve_analysis
 
@@ -27,27 +27,38 @@ def analyze_parsed_notation_file(parsedfile, key_orientation=np.array([0,0,0,4,2
         the starting point for harmony analysis
     beats_per_slice : int
         how often to perform analysis, metrically
+    decoder : str
+        "greedy" (slice by slice) or "viterbi" (best path over the whole file).
+        see partita.analyze_notegroup_list
+    return_rle : bool
+        return one entry per run of repeated slices instead of one per slice
 
     Returns
     -------
     bin_analysis, kpdve_analysis.
         (n, 1) array and (n, 5) array
+    or, with return_rle, (starts, lengths, notegroup, kpdve) per run
     '''
 
     s = parsedfile.chordify()
 
-    pitch_classes = []
+    # one notegroup per chord, with the number of slices it lasts
+    chord_notegroups = []
+    chord_slices = []
     for a_chord in s.recurse().getElementsByClass('Chord'):
         # senthentically reduce to sixteenths (if necessary)
-        sixteenths = int(a_chord.quarterLength // beats_per_slice)
-        for _ in range(sixteenths):
-            pitch_classes.append([])
-            for pc in a_chord.pitches:
-                pitch_classes[-1].append(pc.midi % 12)
+        chord_slices.append(int(a_chord.quarterLength // beats_per_slice))
+        chord_notegroups.append(pt_utils.binary_note_for_chord([pc.midi % 12 for pc in a_chord.pitches]))
 
-    bin_analysis = np.zeros(len(pitch_classes), dtype=int)
-    for i, pc_array in enumerate(pitch_classes):
-        bin_analysis[i] = pt_utils.binary_note_for_chord(pc_array) 
+    # analyze each run of identical slices once
+    starts, lengths, run_notegroups = pt_utils.run_length_encode(np.array(chord_notegroups, dtype=int), 
+                                                                 np.array(chord_slices, dtype=int))
+    run_kpdve = partita.analyze_notegroup_list(run_notegroups, key_orientation, decoder=decoder)
+
+    if return_rle:
+        return starts, lengths, run_notegroups, run_kpdve
+
+    bin_analysis = np.repeat(run_notegroups, lengths)
 
 #    reader_state = harmony_state.harmony_state(start_kpdve=key_orientation)
     
@@ -58,18 +69,27 @@ def analyze_parsed_notation_file(parsedfile, key_orientation=np.array([0,0,0,4,2
 
 #    return bin_analysis, np.array(kpdve_chroma)
 
-    h = harmony_state.harmony_state(start_kpdve=key_orientation)
-    kpdve_chroma = np.zeros((bin_analysis.shape[0], 5), dtype=int)
-
-    for i, ng in np.ndenumerate(bin_analysis):
-        h.change_notegroup(ng)
-        kpdve_chroma[i] = np.array(h.current_kpdve.copy())
+    kpdve_chroma = np.repeat(run_kpdve, lengths, axis=0)
     
     return bin_analysis, kpdve_chroma
 
 
-def analyze_notation_file(filename, key_orientation=np.array([0,0,0,4,2]), beats_per_slice=0.25):
+def iter_notation_notegroups(parsedfile, beats_per_slice=0.25):
+    '''
+    the slices of analyze_parsed_notation_file, one chord at a time, to feed partita.iter_analyze
+
+    Yields
+    ------
+    np.array(slices) (int)
+        the chord's chromatic pitch class set, once per slice it lasts
+    '''
+
+    for a_chord in parsedfile.chordify().recurse().getElementsByClass('Chord'):
+        notegroup = pt_utils.binary_note_for_chord([pc.midi % 12 for pc in a_chord.pitches])
+        yield np.full(int(a_chord.quarterLength // beats_per_slice), notegroup, dtype=int)
+
+
+def analyze_notation_file(filename, key_orientation=np.array([0,0,0,4,2]), beats_per_slice=0.25, decoder="greedy", return_rle=False):
     parsedfile = music21.converter.parse(filename)
-    bin_a, kpdve_a = analyze_parsed_notation_file(parsedfile, key_orientation, beats_per_slice)
 
-    return bin_a, kpdve_a
+    return analyze_parsed_notation_file(parsedfile, key_orientation, beats_per_slice, decoder=decoder, return_rle=return_rle)
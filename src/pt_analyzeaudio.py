@@ -9,11 +9,14 @@ Created on Tue Nov 24 21:47:41 2020
 import numpy as np
 import librosa
 import librosa.display
+import soundfile
+import soxr
 from scipy.special import softmax
 
-import harmony_state
+import partita
 import pt_utils
 import pt_musicutils
+import pt_stagetiming
 
 import matplotlib.pyplot as plt
 from matplotlib import gridspec as gridspec
@@ -25,28 +28,125 @@ sat = 0.9
 light = 0.7
 
 
-def graph_audio_file(filename, key_orientation=np.array([0,0,0,4,3]), chroma_threshold=0.5, filter_chroma=True):
-    y, sr, X, bin_a, kpdve_a, chroma_a = assemble_audio_kpdve_analysis(filename, key_orientation, chroma_threshold=chroma_threshold, filter_chroma=filter_chroma)
+def graph_audio_file(filename, key_orientation=np.array([0,0,0,4,3]), chroma_threshold=0.5, filter_chroma=True, decoder="greedy"):
+    y, sr, X, bin_a, kpdve_a, chroma_a = assemble_audio_kpdve_analysis(filename, key_orientation, chroma_threshold=chroma_threshold, filter_chroma=filter_chroma, decoder=decoder)
     graph_waveform_kpdve_combo(y, sr, bin_a, kpdve_a)
     
 
-def assemble_audio_kpdve_analysis(filename, key_orientation=np.array([0,0,0,4,3]), chroma_threshold=0.5, filter_chroma=True):
+def assemble_audio_kpdve_analysis(filename, key_orientation=np.array([0,0,0,4,3]), chroma_threshold=0.5, filter_chroma=True, decoder="greedy", report=False):
+    '''
+    load, chroma, binarize and analyze an audio file
+
+    Parameters
+    ----------
+    report : bool or pt_stagetiming.stage_report, optional
+        time each stage (load, chroma_stft, nn_filter, binarize, kpdve, stft)
+        and return the report as a seventh value. Pass a stage_report to
+        add to it (e.g. over a batch of files). The default is False: no timing.
+
+    Returns
+    -------
+    y, sr, X, bin_a, kpdve_a, chroma_a (, stage_report)
+        X is a lazy_stft: librosa.stft(y) is only computed when X is first used
+    '''
+
+    timing = pt_stagetiming.NO_TIMING
+    if report is True:
+        timing = pt_stagetiming.stage_report()
+    elif report:
+        timing = report
+
     y, sr, chroma_a = chroma_analyze_audiofile(filename, 
                                                hop_length=2048, 
-                                               filter_chroma=filter_chroma)
+                                               filter_chroma=filter_chroma,
+                                               timing=timing)
 
     bin_a, kpdve_a = analyze_chroma_list(chroma_a, 
                                          threshold=chroma_threshold,
-                                         key_orientation=key_orientation)
+                                         key_orientation=key_orientation,
+                                         decoder=decoder,
+                                         timing=timing)
 
-    X = librosa.stft(y)
+    X = lazy_stft(y, timing=timing)
+
+    if report:
+        return y, sr, X, bin_a, kpdve_a, chroma_a, timing
 
     return y, sr, X, bin_a, kpdve_a, chroma_a
 
 
-def kpdve_analyze_audiofile(filename, key_orientation=np.array([0,0,0,4,3]), chroma_threshold=0.5, filter_chroma=True):
-    _, _, _, bin_a, kpdve_a, _ = assemble_audio_kpdve_analysis(filename, key_orientation, chroma_threshold=chroma_threshold, filter_chroma=filter_chroma)
-    return bin_a, kpdve_a
+def kpdve_analyze_audiofile(filename, key_orientation=np.array([0,0,0,4,3]), chroma_threshold=0.5, filter_chroma=True, decoder="greedy", report=False, block_length=None):
+    if block_length is not None:
+        # bounded memory: see kpdve_analyze_long_audiofile
+        if decoder != "greedy":
+            raise ValueError("block_length (streaming) analysis is greedy only")
+        if report:
+            raise ValueError("block_length (streaming) analysis is not timed: no report")
+        return kpdve_analyze_long_audiofile(filename, key_orientation, chroma_threshold=chroma_threshold, 
+                                            filter_chroma=filter_chroma, block_length=block_length)
+
+    results = assemble_audio_kpdve_analysis(filename, key_orientation, chroma_threshold=chroma_threshold, filter_chroma=filter_chroma, decoder=decoder, report=report)
+    if report:
+        return results[3], results[4], results[6]
+
+    return results[3], results[4]
+
+
+class lazy_stft():
+    '''
+    librosa.stft(y), computed the first time it is used: as an array
+    (np.asarray(X), np.abs(X)...), through an array attribute (X.shape), by
+    indexing, or explicitly with X.value. Callers that only want the
+    analysis never pay for it.
+    '''
+
+    __slots__ = ('y', 'kwargs', 'timing', '_value')
+
+    def __init__(self, y, timing=pt_stagetiming.NO_TIMING, **stft_kwargs):
+        self.y = y
+        self.kwargs = stft_kwargs
+        self.timing = timing
+        self._value = None
+
+
+    @property
+    def value(self):
+        if self._value is None:
+            with self.timing.stage("stft") as stage:
+                self._value = librosa.stft(self.y, **self.kwargs)
+                stage.add(self._value, frames=self._value.shape[1])
+            self.y = None
+
+        return self._value
+
+
+    @property
+    def computed(self):
+        return self._value is not None
+
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.value
+        return self.value.astype(dtype)
+
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.value, name)
+
+
+    def __getitem__(self, index):
+        return self.value[index]
+
+
+    def __len__(self):
+        return len(self.value)
+
+
+    def __repr__(self):
+        return f"lazy_stft(computed={self.computed})"
 
 
 # CHROMA TOOLS
@@ -68,14 +168,21 @@ def chroma_list_to_binary_list(a_chroma, threshold=0.5):
 
     '''
 
-    bin_chroma = np.zeros(a_chroma.shape[1], dtype=int)
+    return pt_utils.chroma_to_binary_array(a_chroma, threshold)
 
-    for i in range(a_chroma.shape[1]):
-        notegroup = 0
-        count = 0
-        bin_chroma[i] = chroma_to_binary_value(a_chroma[:, i], threshold)
 
-    return bin_chroma
+def iter_chroma_notegroups(a_chroma, threshold=0.5, chunk=1024):
+    '''
+    chroma_list_to_binary_list a chunk of frames at a time, to feed partita.iter_analyze
+
+    Yields
+    ------
+    np.array(chunk) (int)
+        chromatic pitch class sets
+    '''
+
+    for i in range(0, a_chroma.shape[1], chunk):
+        yield chroma_list_to_binary_list(a_chroma[:, i:i + chunk], threshold)
 
 # 1AC
 def chroma_to_binary_value(chroma_stripe, threshold=0.5):
@@ -94,20 +201,12 @@ def chroma_to_binary_value(chroma_stripe, threshold=0.5):
     >>> chroma_to_binary_value(np.array([0,0,0,0,0,2,0,0,0,0,0,0]))
     64
     '''
-    notegroup = 0
-    count = 0
-    
-    ### THE ROOT OF THE THRESHOLD SEQUENCE...
-    for a_val in chroma_stripe:
-        if a_val > threshold :
-            notegroup |= pt_utils.LEFT_BIT >> count
-        count += 1
-        
-    return notegroup
+    ### THE ROOT OF THE THRESHOLD SEQUENCE... (see pt_utils.chroma_to_binary_array)
+    return pt_utils.chroma_to_binary_array(chroma_stripe, threshold)
     
     
 # 1AA
-def analyze_chroma_list(chroma, threshold=0.5, key_orientation=np.array([0,0,0,4,2])):
+def analyze_chroma_list(chroma, threshold=0.5, key_orientation=np.array([0,0,0,4,2]), decoder="greedy", return_rle=False, timing=pt_stagetiming.NO_TIMING):
     '''
     given the chroma list of an audio file, perform a matching KPDVE analysis
 
@@ -117,28 +216,42 @@ def analyze_chroma_list(chroma, threshold=0.5, key_orientation=np.array([0,0,0,4
         a chroma list from an audio file
     threshold (optional):
         the intensity beyond which a chroma gets marked as a 'yes'
+    decoder (optional):
+        "greedy" (frame by frame) or "viterbi" (best path over the whole file).
+        see partita.analyze_notegroup_list
+    return_rle (optional):
+        return runs of repeated notegroups instead of frames
+    timing (optional):
+        a pt_stagetiming.stage_report for the binarize and kpdve stages
 
     Returns
     -------
     binary, and KPDVE analyses as tuple
+    or, with return_rle, (starts, lengths, notegroup, kpdve) per run
 
     '''
 
-    h = harmony_state.harmony_state(start_kpdve=key_orientation)
-
     # make a binary version for particular naming -- binary chroma is a single 12-bit integer
-    binary_chroma = chroma_list_to_binary_list(chroma, threshold)
-    kpdve_chroma = np.zeros((binary_chroma.shape[0], 5), dtype=int)
+    with timing.stage("binarize") as stage:
+        binary_chroma = chroma_list_to_binary_list(chroma, threshold)
+        stage.add(binary_chroma, frames=len(binary_chroma))
+
+    with timing.stage("kpdve") as stage:
+        if return_rle:
+            runs = partita.analyze_notegroup_list(binary_chroma, key_orientation, decoder=decoder, return_rle=True)
+            stage.add(*runs, frames=len(binary_chroma))
+        else:
+            kpdve_chroma = partita.analyze_notegroup_list(binary_chroma, key_orientation, decoder=decoder)
+            stage.add(kpdve_chroma, frames=len(kpdve_chroma))
+
+    if return_rle:
+        return runs
 
-    for i, ng in np.ndenumerate(binary_chroma):
-        h.change_notegroup(ng)
-        kpdve_chroma[i] = h.current_kpdve.copy()
-    
     return binary_chroma, kpdve_chroma
 
 # =============================    
 # 1A GET AUDIO TO ANALYZABLE FORM
-def chroma_analyze_audiofile(filename, hop_length=1024, filter_chroma=True):
+def chroma_analyze_audiofile(filename, hop_length=1024, filter_chroma=True, timing=pt_stagetiming.NO_TIMING):
     '''
     
 
@@ -152,30 +265,340 @@ def chroma_analyze_audiofile(filename, hop_length=1024, filter_chroma=True):
         for starting the analysis, a location indicating key. The default is np.array([0,0,0,4,2]).
     filter_chroma : bool, optional
         do k-neighbor filtering in librosa. The default is True.
+    timing : pt_stagetiming.stage_report, optional
+        times the load, chroma_stft and nn_filter stages
 
     Returns
     -------
     tuple: y, sr, chroma_a
     '''
     
-    y, sr = librosa.load(filename)
+    with timing.stage("load") as stage:
+        y, sr = librosa.load(filename)
+        stage.add(y, frames=len(y))
     # chroma_a = librosa.feature.chroma_cqt(y=y,
     #                                       sr=sr,
     #                                       bins_per_octave=12*3,
     #                                       hop_length=hop_length)
     
-    chroma_a = librosa.feature.chroma_stft(y=y,
-                                          sr=sr)
+    with timing.stage("chroma_stft") as stage:
+        chroma_a = librosa.feature.chroma_stft(y=y,
+                                              sr=sr)
+        stage.add(chroma_a, frames=chroma_a.shape[1])
 
     if (filter_chroma):
-        chroma_a = np.minimum(chroma_a,
-                              librosa.decompose.nn_filter(chroma_a,
-                                                          aggregate=np.mean,
-                                                          metric='cosine'))
+        with timing.stage("nn_filter") as stage:
+            chroma_a = filter_chroma_window(chroma_a)
+            stage.add(chroma_a, frames=chroma_a.shape[1])
         
     return y, sr, chroma_a
 
 
+# =============================
+# 1A (STREAMING) LONG FILES IN BLOCKS: MEMORY SET BY block_length, NOT BY THE FILE
+def audiofile_length(filename, sr=22050):
+    '''
+    the number of samples librosa.load(filename, sr=sr) gives, without reading them
+    '''
+
+    info = soundfile.info(filename)
+    if sr is None or sr == info.samplerate:
+        return info.frames
+    return int(np.ceil(info.frames * sr / info.samplerate))
+
+
+def iter_audio_samples(filename, sr=22050, block_samples=65536):
+    '''
+    the samples librosa.load(filename, sr=sr) gives, in consecutive blocks: mixed to
+    mono and resampled the same way (soxr, high quality), with the resampler's state
+    carried from block to block, and fixed to the same length
+
+    Parameters
+    ----------
+    filename : str
+        an audio file that soundfile can read (wav, flac, ogg, mp3...)
+    sr : int or None
+        sample rate of the result. None: the file's own.
+    block_samples : int
+        samples read from the file at a time
+
+    Yields
+    ------
+    np.array (float32)
+    '''
+
+    info = soundfile.info(filename)
+    length = audiofile_length(filename, sr)
+    resampler = None
+    if sr is not None and sr != info.samplerate:
+        resampler = soxr.ResampleStream(info.samplerate, sr, 1, dtype='float32', quality='soxr_hq')
+
+    emitted = 0
+    for block in soundfile.blocks(filename, blocksize=block_samples, dtype='float32', always_2d=True):
+        y = block.mean(axis=1)
+        if resampler is not None:
+            y = resampler.resample_chunk(y)
+        y = y[:length - emitted]
+        emitted += len(y)
+        if len(y):
+            yield y
+
+    if resampler is not None:
+        y = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)[:length - emitted]
+        emitted += len(y)
+        if len(y):
+            yield y
+
+    if emitted < length:  # as librosa.util.fix_length
+        yield np.zeros(length - emitted, dtype=np.float32)
+
+
+def iter_power_spectrogram(samples, block_length=1024, n_fft=2048, hop_length=512):
+    '''
+    np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length)) ** 2 of the samples
+    in an iterable of blocks, block_length frames at a time
+
+    Frames are centered as in one pass (center=True): the stream is padded with
+    n_fft // 2 zeros at each end, and consecutive spans overlap by n_fft - hop_length.
+
+    Yields
+    ------
+    np.array(1 + n_fft // 2, block_length)
+        the last may be shorter
+    '''
+
+    def power(y):
+        return np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length, center=False)) ** 2
+
+    span = n_fft + (block_length - 1) * hop_length
+    step = block_length * hop_length
+
+    pending = np.zeros(n_fft // 2, dtype=np.float32)
+    for y in samples:
+        pending = np.concatenate((pending, y))
+        while len(pending) >= span:
+            yield power(pending[:span])
+            pending = pending[step:]
+
+    pending = np.concatenate((pending, np.zeros(n_fft // 2, dtype=np.float32)))
+    if len(pending) >= n_fft:
+        yield power(pending)
+
+
+# magnitudes (log10) of pitched bins, bucketed to find their median without keeping them
+TUNING_LOG_MAGNITUDES = (-12.0, 12.0)
+TUNING_LOG_MAGNITUDE_STEP = 0.001
+
+
+def estimate_audiofile_tuning(filename, sr=22050, block_length=1024, n_fft=2048, hop_length=512, resolution=0.01):
+    '''
+    the tuning librosa.feature.chroma_stft estimates for the whole file
+    (librosa.estimate_tuning), from one pass in blocks, in fixed memory
+
+    Each pitched bin is counted in a histogram by its magnitude (log10 buckets of
+    TUNING_LOG_MAGNITUDE_STEP) and its deviation from the nearest semitone (bins of
+    resolution, as librosa.pitch_tuning). The bins kept are those of the magnitude
+    buckets from the one holding the median up: all of the bins librosa keeps, and
+    those just under the median in the same bucket.
+    '''
+
+    low, high = TUNING_LOG_MAGNITUDES
+    n_magnitudes = int(np.ceil((high - low) / TUNING_LOG_MAGNITUDE_STEP))
+    edges = np.linspace(-0.5, 0.5, int(np.ceil(1.0 / resolution)) + 1)
+    counts = np.zeros((n_magnitudes, len(edges) - 1), dtype=np.int32)
+
+    for S in iter_power_spectrogram(iter_audio_samples(filename, sr), block_length, n_fft, hop_length):
+        pitch, mag = librosa.piptrack(S=S, sr=sr)
+        pitched = pitch > 0
+        pitch = pitch[pitched]
+        mag = mag[pitched]
+
+        # as librosa.pitch_tuning
+        residual = np.mod(12 * librosa.hz_to_octs(pitch), 1.0)
+        residual[residual >= 0.5] -= 1.0
+        residual_bins = np.clip(np.searchsorted(edges, residual, side='right') - 1, 0, len(edges) - 2)
+
+        with np.errstate(divide='ignore'):
+            log_mag = np.log10(mag)
+        magnitude_bins = np.clip(np.floor((log_mag - low) / TUNING_LOG_MAGNITUDE_STEP), 0, n_magnitudes - 1).astype(int)
+
+        np.add.at(counts, (magnitude_bins, residual_bins), 1)
+
+    by_magnitude = counts.sum(axis=1)
+    total = by_magnitude.sum()
+    if total == 0:
+        return 0.0
+
+    median_bucket = np.searchsorted(np.cumsum(by_magnitude), (total - 1) // 2, side='right')
+    kept = counts[median_bucket:].sum(axis=0)
+
+    return float(edges[np.argmax(kept)])
+
+
+def filter_chroma_window(chroma_a, k=None):
+    '''
+    the neighbor filter of chroma_analyze_audiofile: each frame no louder than the
+    mean of its k nearest (cosine) frames
+
+    Parameters
+    ----------
+    k : int, optional
+        neighbors. The default, librosa's, grows with the number of frames.
+    '''
+
+    return np.minimum(chroma_a,
+                      librosa.decompose.nn_filter(chroma_a,
+                                                  aggregate=np.mean,
+                                                  metric='cosine',
+                                                  k=k))
+
+
+def iter_filtered_chroma(blocks, filter_context=2048, filter_k=None):
+    '''
+    filter_chroma_window over a sliding window: each block is filtered among
+    itself and up to filter_context frames on either side, with the same k
+    throughout, and yielded as soon as the frames after it have arrived
+
+    Parameters
+    ----------
+    blocks : iterable of np.array(12, n)
+        consecutive chroma blocks (the last may be shorter)
+    filter_context : int
+        frames on either side of a block among which its neighbors are sought
+    filter_k : int, optional
+        neighbors per frame. The default is librosa's for a full window
+        (first block + 2 * filter_context frames).
+
+    Yields
+    ------
+    np.array(12, n)
+        the blocks, filtered
+    '''
+
+    before = np.zeros((12, 0))    # up to filter_context frames already yielded
+    pending = np.zeros((12, 0))   # frames not yet yielded
+    block_length = None
+
+    def filtered(ahead, n):
+        window = np.hstack((before, ahead))
+        return filter_chroma_window(window, k=filter_k)[:, before.shape[1]:before.shape[1] + n]
+
+    for chroma_a in blocks:
+        if block_length is None:
+            block_length = max(chroma_a.shape[1], 1)
+            if filter_k is None:
+                filter_k = 2 * int(np.ceil(np.sqrt(block_length + 2 * filter_context)))
+
+        pending = np.hstack((pending, chroma_a))
+        while pending.shape[1] >= block_length + filter_context:
+            yield filtered(pending[:, :block_length + filter_context], block_length)
+            before = np.hstack((before, pending[:, :block_length]))
+            before = before[:, max(0, before.shape[1] - filter_context):]
+            pending = pending[:, block_length:]
+
+    while pending.shape[1]:
+        n = min(block_length, pending.shape[1])
+        yield filtered(pending, n)
+        before = np.hstack((before, pending[:, :n]))
+        before = before[:, max(0, before.shape[1] - filter_context):]
+        pending = pending[:, n:]
+
+
+def iter_chroma_audiofile(filename, block_length=1024, sr=22050, hop_length=512, n_fft=2048, filter_chroma=True, 
+                          tuning=None, filter_context=2048, filter_k=None):
+    '''
+    the chroma of chroma_analyze_audiofile, block_length frames at a time: the audio,
+    its spectrogram and its chroma are never held for more than a block (and, with
+    filter_chroma, the filter's window around it)
+
+    The frames are the same as in one pass: same sample rate, centered frames, and
+    the tuning of the whole file (estimated in a first pass over the file, unless given;
+    see estimate_audiofile_tuning). Without filter_chroma, the chroma is that of
+    chroma_analyze_audiofile. The neighbor filter, though, seeks each frame's
+    neighbors only within filter_context frames of its block (iter_filtered_chroma),
+    where one pass seeks them in the whole file: with filter_chroma, the chroma equals
+    one pass's only for files of up to block_length + filter_context frames. Unless
+    given, filter_k is librosa's for the file, or for a full window if that is shorter.
+
+    Parameters
+    ----------
+    filename : str
+        an audio file that soundfile can read (wav, flac, ogg, mp3...)
+    block_length : int
+        frames per block
+    sr : int or None
+        the sample rate to analyze at (librosa.load's default). None: the file's own.
+    hop_length, n_fft : int
+        as in librosa.feature.chroma_stft
+    filter_chroma : bool
+        k-neighbor filtering, as in chroma_analyze_audiofile
+    tuning : float, optional
+        as in librosa.feature.chroma_stft. The default estimates it as one pass would.
+    filter_context, filter_k : int
+        the filter's window and neighbors: see iter_filtered_chroma
+
+    Yields
+    ------
+    np.array(12, block_length)
+        chroma for consecutive blocks (the last may be shorter)
+    '''
+
+    sr = soundfile.info(filename).samplerate if sr is None else sr
+    if tuning is None:
+        tuning = estimate_audiofile_tuning(filename, sr, block_length, n_fft, hop_length)
+
+    spectrograms = iter_power_spectrogram(iter_audio_samples(filename, sr), block_length, n_fft, hop_length)
+    blocks = (librosa.feature.chroma_stft(S=S, sr=sr, tuning=tuning) for S in spectrograms)
+
+    if filter_chroma:
+        if filter_k is None:
+            frames = 1 + audiofile_length(filename, sr) // hop_length
+            filter_k = 2 * int(np.ceil(np.sqrt(min(frames, block_length + 2 * filter_context))))
+        blocks = iter_filtered_chroma(blocks, filter_context, filter_k)
+
+    yield from blocks
+
+
+def iter_audio_kpdve_analysis(filename, key_orientation=np.array([0,0,0,4,3]), chroma_threshold=0.5, filter_chroma=True, 
+                              block_length=1024, **chroma_kwargs):
+    '''
+    kpdve_analyze_audiofile in blocks: the harmony state carries from block to
+    block (partita.iter_analyze), so without filter_chroma the analysis is the one
+    kpdve_analyze_audiofile gives; with it, the neighbor filter's window is bounded
+    (see iter_chroma_audiofile)
+
+    Yields
+    ------
+    (np.array(m) (int), np.array(m, 5) (int))
+        notegroups and kpdve values for consecutive blocks
+    '''
+
+    notegroups = (chroma_list_to_binary_list(chroma_a, chroma_threshold) 
+                  for chroma_a in iter_chroma_audiofile(filename, block_length, filter_chroma=filter_chroma, **chroma_kwargs))
+
+    yield from partita.iter_analyze(notegroups, key_orientation, chunk=block_length)
+
+
+def kpdve_analyze_long_audiofile(filename, key_orientation=np.array([0,0,0,4,3]), chroma_threshold=0.5, filter_chroma=True, 
+                                 block_length=1024, **chroma_kwargs):
+    '''
+    iter_audio_kpdve_analysis collected: bin_a, kpdve_a for the whole file
+    (six ints a frame; the audio and spectrogram never exceed one block)
+    '''
+
+    bin_chunks = []
+    kpdve_chunks = []
+    for bin_a, kpdve_a in iter_audio_kpdve_analysis(filename, key_orientation, chroma_threshold, filter_chroma, 
+                                                    block_length, **chroma_kwargs):
+        bin_chunks.append(bin_a)
+        kpdve_chunks.append(kpdve_a)
+
+    if not bin_chunks:
+        return np.zeros(0, dtype=int), np.zeros((0, 5), dtype=int)
+
+    return np.concatenate(bin_chunks), np.concatenate(kpdve_chunks)
+
+
 def graph_chroma(chroma_a):
     fig = plt.figure(frameon=False, figsize=(12, 1))
     sb.heatmap(chroma_a,
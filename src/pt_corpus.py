@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Analyze a whole directory of notation (MIDI, MusicXML...) and audio files
+over a pool of processes, one file per task.
+
+Each result is written with pt_datafiles.save_bin_kpd_file next to its place
+in the output directory (same relative path, with .npy added to the source
+name, so x.mid and x.wav do not collide), together with the analysis
+parameters that made it (.params.json). Results are written to a temporary
+name and renamed when complete, so a file either has a whole result or none:
+after a crash, running again picks up where it stopped (results newer than
+their source, made with the same parameters, are skipped).
+
+From the command line:
+    python pt_corpus.py path/to/corpus --out path/to/results --workers 32 --timeout 600
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import pt_datafiles
+
+
+NOTATION_EXTENSIONS = ('.mid', '.midi', '.xml', '.musicxml', '.mxl', '.krn', '.abc')
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.ogg', '.aif', '.aiff', '.m4a')
+
+# each worker is one core: keep numpy's own thread pools out of the way
+SINGLE_THREAD_ENV = {"OMP_NUM_THREADS": "1", "OPENBLAS_NUM_THREADS": "1", "MKL_NUM_THREADS": "1", "NUMBA_NUM_THREADS": "1"}
+
+# a result is written as stem + PARTIAL + suffix, then renamed
+PARTIAL = ".partial"
+PARTIAL_SUFFIXES = (PARTIAL + ".npy", PARTIAL + ".params.json")
+
+
+class analysis_timeout(Exception):
+    pass
+
+
+# =============================================================================
+# FILES
+# =============================================================================
+
+def find_corpus_files(directory):
+    '''
+    every notation and audio file under directory, in sorted order
+    '''
+
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(NOTATION_EXTENSIONS + AUDIO_EXTENSIONS):
+                found.append(os.path.join(root, name))
+
+    return found
+
+
+def output_stem(filename, directory, out_directory):
+    '''
+    the name to hand to pt_datafiles.save_bin_kpd_file (it adds '.npy'): the source's
+    extension stays, so sources that differ only by extension get results of their own
+
+    >>> output_stem("corpus/bach/bwv66.6.mxl", "corpus", "results")
+    'results/bach/bwv66.6.mxl'
+    '''
+
+    relative = os.path.relpath(filename, directory)
+    return os.path.join(out_directory, relative)
+
+
+def analysis_parameters(key_orientation=None, decoder="greedy"):
+    '''
+    the parameters stored with each result (None: the analyzer's own default)
+
+    >>> analysis_parameters(np.array([0,0,0,4,2]), "viterbi")
+    {'key_orientation': [0, 0, 0, 4, 2], 'decoder': 'viterbi'}
+    '''
+
+    return {"key_orientation": None if key_orientation is None else [int(x) for x in key_orientation],
+            "decoder": decoder}
+
+
+def is_up_to_date(filename, stem, parameters):
+    '''
+    True if the result for filename exists, is newer than the file and was made
+    with the same parameters
+    '''
+
+    result = stem + ".npy"
+    if not (os.path.exists(result) and os.path.getmtime(result) >= os.path.getmtime(filename)):
+        return False
+
+    try:
+        with open(stem + ".params.json") as f:
+            return json.load(f) == parameters
+    except (OSError, ValueError):
+        return False
+
+
+# =============================================================================
+# ONE FILE (runs in a worker)
+# =============================================================================
+
+def remove_partial(stem):
+    '''
+    delete what an analysis of stem left half-written (see analyze_corpus_file)
+    '''
+
+    for suffix in PARTIAL_SUFFIXES:
+        try:
+            os.remove(stem + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def _raise_timeout(signum, frame):
+    raise analysis_timeout()
+
+
+def _single_thread_worker():
+    # each worker is one core. numpy is already loaded here (unpickling this function
+    # imported it), so the variables only reach what reads them later; the thread
+    # pools already running are limited through threadpoolctl where it is installed
+    os.environ.update({k: v for k, v in SINGLE_THREAD_ENV.items() if k not in os.environ})
+    try:
+        import threadpoolctl
+    except ImportError:
+        return
+    threadpoolctl.threadpool_limits(1)
+
+
+def analyze_corpus_file(filename, stem, timeout=None, key_orientation=None, decoder="greedy"):
+    '''
+    analyze one file and write its result
+
+    Parameters
+    ----------
+    filename : str
+        a notation or audio file
+    stem : str
+        where to write (see output_stem)
+    timeout : float, optional
+        seconds before the file is abandoned (where SIGALRM exists)
+    key_orientation : np.array(5), optional
+        the starting point for harmony analysis. The default is the analyzer's own
+        (pt_analyzeaudio and pt_analyzeMIDI differ).
+    decoder : str
+        see partita.analyze_notegroup_list
+
+    Returns
+    -------
+    (filename, status, frames, seconds, message)
+        status is "done", "timeout" or "error"
+
+    '''
+
+    start = time.perf_counter()
+    use_alarm = timeout is not None and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    kwargs = {"decoder": decoder}
+    if key_orientation is not None:
+        kwargs["key_orientation"] = key_orientation
+
+    try:
+        # import on demand: a notation corpus does not need librosa, nor audio music21
+        if filename.lower().endswith(AUDIO_EXTENSIONS):
+            import pt_analyzeaudio
+            bin_a, kpdve_a = pt_analyzeaudio.kpdve_analyze_audiofile(filename, **kwargs)
+        else:
+            import pt_analyzeMIDI
+            bin_a, kpdve_a = pt_analyzeMIDI.analyze_notation_file(filename, **kwargs)
+
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+        # write under a temporary name, then rename: never a half-written result
+        os.makedirs(os.path.dirname(stem) or ".", exist_ok=True)
+        partial = stem + PARTIAL
+        pt_datafiles.save_bin_kpd_file(partial, bin_a, kpdve_a)
+        os.replace(partial + ".npy", stem + ".npy")
+
+        # the parameters last: a result without them is never taken as up to date
+        with open(partial + ".params.json", "w") as f:
+            json.dump(analysis_parameters(key_orientation, decoder), f)
+        os.replace(partial + ".params.json", stem + ".params.json")
+
+        return filename, "done", len(bin_a), time.perf_counter() - start, ""
+
+    except analysis_timeout:
+        remove_partial(stem)
+        return filename, "timeout", 0, time.perf_counter() - start, f"over {timeout} s"
+    except Exception as e:
+        remove_partial(stem)
+        return filename, "error", 0, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+# =============================================================================
+# THE CORPUS
+# =============================================================================
+
+def analyze_corpus(directory, out_directory=None, workers=None, timeout=None, key_orientation=None,
+                   decoder="greedy", force=False, verbose=True):
+    '''
+    analyze every file under directory over a process pool
+
+    Parameters
+    ----------
+    directory : str
+        the corpus
+    out_directory : str, optional
+        where results go. The default is directory itself.
+    workers : int, optional
+        number of processes. The default is os.cpu_count().
+    timeout : float, optional
+        seconds per file
+    key_orientation : np.array(5), optional
+        the starting point for harmony analysis. The default is each analyzer's own.
+    decoder : str
+        see partita.analyze_notegroup_list
+    force : bool
+        analyze files whose results are up to date too
+    verbose : bool
+        print a line per file and the throughput report
+
+    Returns
+    -------
+    dict
+        counts per status, frames, seconds, and the failed files with their messages
+
+    '''
+
+    out_directory = directory if out_directory is None else out_directory
+    workers = os.cpu_count() if workers is None else workers
+
+    files = find_corpus_files(directory)
+    parameters = analysis_parameters(key_orientation, decoder)
+    jobs = [(f, output_stem(f, directory, out_directory)) for f in files]
+    if not force:
+        jobs = [(f, stem) for f, stem in jobs if not is_up_to_date(f, stem, parameters)]
+
+    # left by a run that crashed or was killed while writing
+    for f, stem in jobs:
+        remove_partial(stem)
+
+    report = {"files": len(files), "skipped": len(files) - len(jobs), "done": 0, "timeout": 0, "error": 0,
+              "frames": 0, "seconds": 0.0, "failed": {}}
+
+    start = time.perf_counter()
+
+    if jobs:
+        context = multiprocessing.get_context("spawn")
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=context,
+                                 initializer=_single_thread_worker) as pool:
+            futures = {pool.submit(analyze_corpus_file, f, stem, timeout, key_orientation, decoder): (f, stem) for f, stem in jobs}
+
+            for future in as_completed(futures):
+                try:
+                    filename, status, frames, seconds, message = future.result()
+                except Exception as e:  # the worker itself died
+                    filename, stem = futures[future]
+                    remove_partial(stem)
+                    status, frames, seconds, message = "error", 0, 0.0, f"{type(e).__name__}: {e}"
+
+                report[status] += 1
+                report["frames"] += frames
+                if status != "done":
+                    report["failed"][filename] = message
+
+                if verbose:
+                    finished = report["done"] + report["timeout"] + report["error"]
+                    print(f"[{finished}/{len(jobs)}] {status:7} {frames:8d} frames {seconds:7.1f} s  {filename} {message}")
+
+    report["seconds"] = time.perf_counter() - start
+
+    if verbose:
+        print_throughput(report, workers)
+
+    return report
+
+
+def print_throughput(report, workers):
+    elapsed = max(report["seconds"], 1e-9)
+    analyzed = report["done"] + report["timeout"] + report["error"]
+
+    print(f"{report['files']} files: {report['done']} analyzed, {report['skipped']} up to date, "
+          f"{report['timeout']} timed out, {report['error']} failed")
+    print(f"{elapsed:.1f} s on {workers} workers: {analyzed / elapsed:.2f} files/s, {report['frames'] / elapsed:.0f} frames/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="analyze a directory of notation and audio files")
+    parser.add_argument("directory")
+    parser.add_argument("--out", default=None, help="results directory (default: next to the sources)")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per file")
+    parser.add_argument("--decoder", default="greedy", choices=["greedy", "viterbi"])
+    parser.add_argument("--key-orientation", type=int, nargs=5, default=None, metavar=("K", "P", "D", "V", "E"),
+                        help="starting KPDVE (default: each analyzer's own)")
+    parser.add_argument("--force", action="store_true", help="analyze files with up-to-date results too")
+    args = parser.parse_args()
+
+    key_orientation = None if args.key_orientation is None else np.array(args.key_orientation)
+    report = analyze_corpus(args.directory, args.out, args.workers, args.timeout, key_orientation=key_orientation,
+                            decoder=args.decoder, force=args.force)
+    sys.exit(1 if report["failed"] else 0)
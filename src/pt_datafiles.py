@@ -69,15 +69,10 @@ def pack_bin_kpdve_data_from_list_analysis(bin_a, kpdve_a):
     a combination of the binary and kpdve values, as a list of integers.
     
     >>> pack_bin_kpdve_data_from_list_analysis(np.array([[2244]]), np.array([[0,0,0,4,3]]))
-    array([145604])
+    array([145604], dtype=uint32)
     '''
     
-    packed_a = np.zeros(len(bin_a), dtype=int)
-    
-    for i in range(bin_a.shape[0]):
-        packed_a[i] = pt_utils.minimal_bin_kpdve(bin_a[i], kpdve_a[i])
-        
-    return packed_a
+    return pt_utils.minimal_bin_kpdve_array(bin_a, kpdve_a)
 
 
 def unpack_bin_kpdve_data_from_packed_list(packed_a):
@@ -98,14 +93,7 @@ def unpack_bin_kpdve_data_from_packed_list(packed_a):
     
     '''
     
-    bin_a = np.zeros(len(packed_a), dtype=int)
-    kpdve_a = np.zeros((len(packed_a), 5), dtype=int)
-    
-    for i, pckd in enumerate(packed_a):
-        bin_a[i], kpdve_a[i] = pt_utils.bin_kpdve_from_minimal(pckd)
-    
-    return bin_a, kpdve_a
-
+    return pt_utils.bin_kpdve_from_minimal_array(packed_a)
 
 
 # read/write
@@ -245,7 +245,9 @@ def raw_kp_voxel():
 # Main Call from Partita
 def get_KPDVE_list_for_notegroup(notegroup, v_opt=-1):
     '''
-    
+    read the candidate list for a notegroup from the precomputed table 
+    (see KPDVE_candidate_table). The result is a fresh copy, identical to 
+    search_KPDVE_list_for_notegroup.
     
     Parameters
     ----------
@@ -277,6 +279,32 @@ def get_KPDVE_list_for_notegroup(notegroup, v_opt=-1):
     
     '''
 
+    if notegroup < 0 or notegroup > pt_utils.CHROMATIC_SCALE:
+        return search_KPDVE_list_for_notegroup(notegroup, v_opt)
+
+    offsets, data = KPDVE_candidate_table(v_opt)
+    return data[offsets[notegroup]:offsets[notegroup + 1]].astype(int)
+
+
+def search_KPDVE_list_for_notegroup(notegroup, v_opt=-1):
+    '''
+    the full search behind the candidate table: test every KP mask, then 
+    find D, V and E for each match.
+
+    Parameters
+    ----------
+    notegroup : a twelve-bit integer for a circle-based pitch-class set
+
+    Returns
+    -------
+    a Numpy array of form [[K1,P1,D1,V1,E1] ... [Kn, Pn, Dn, Vn, Dn]]
+
+    No Match
+    >>> search_KPDVE_list_for_notegroup(0b11111111)
+    array([[12,  7,  7,  7,  7]])
+
+    '''
+
     kp_list = get_KP_list_for_notegroup(notegroup)
     
     # this is the point to check for bitonality
@@ -287,6 +315,82 @@ def get_KPDVE_list_for_notegroup(notegroup, v_opt=-1):
     return KP_list_to_KPDVE_list(kp_list, notegroup, v_opt)
 
 
+# =================================================================
+# CANDIDATE TABLE: there are only 4096 notegroups, so the search in 
+# search_KPDVE_list_for_notegroup is run once per notegroup and v_opt
+# and kept as a ragged (offsets, data) pair.
+# =================================================================
+_KPDVE_CANDIDATE_TABLES = {}
+
+
+def KPDVE_candidate_table(v_opt=-1):
+    '''
+    the candidate KPDVE lists for every circle-based notegroup (0-4095), 
+    built on first request for a v_opt and shared afterwards.
+    the list for notegroup n is data[offsets[n]:offsets[n+1]]
+
+    Parameters
+    ----------
+    v_opt : int, optional
+        selects from v_options. The default is -1.
+
+    Returns
+    -------
+    offsets : np.array(4097) (int)
+    data : np.array(n, 5) (int8)
+        both arrays are read-only
+
+    >>> offsets, data = KPDVE_candidate_table()
+    >>> data[offsets[0b101100100101]:offsets[0b101100100101 + 1]]
+    array([[9, 4, 0, 6, 5]], dtype=int8)
+    '''
+
+    v_opt = v_opt % len(v_options)
+
+    if v_opt not in _KPDVE_CANDIDATE_TABLES:
+        _KPDVE_CANDIDATE_TABLES[v_opt] = build_KPDVE_candidate_table(v_opt)
+
+    return _KPDVE_CANDIDATE_TABLES[v_opt]
+
+
+def build_KPDVE_candidate_table(v_opt=-1):
+    '''
+    run the full search for all 4096 notegroups (see KPDVE_candidate_table)
+
+    Parameters
+    ----------
+    v_opt : int, optional
+        selects from v_options. The default is -1.
+
+    Returns
+    -------
+    offsets : np.array(4097) (int)
+    data : np.array(n, 5) (int8)
+
+    '''
+
+    notegroups = np.arange(pt_utils.CHROMATIC_SCALE + 1)
+    matches = KP_match_matrix(notegroups)
+    kp_all = np.array([[k, p, 0, 0, 0] for k in range(pt_utils.MODVALS[0]) for p in range(pt_utils.MODVALS[1])])
+
+    kpdve_lists = []
+    for ng in notegroups:
+        kp_list = kp_all[matches[ng]]
+        if len(kp_list) == 0:
+            kpdve_lists.append(np.array([pt_utils.MODVALS]))
+        else:
+            kpdve_lists.append(KP_list_to_KPDVE_list(kp_list, ng, v_opt))
+
+    offsets = np.zeros(len(kpdve_lists) + 1, dtype=int)
+    offsets[1:] = np.cumsum([len(a_list) for a_list in kpdve_lists])
+    data = np.concatenate(kpdve_lists).astype(np.int8)
+
+    offsets.flags.writeable = False
+    data.flags.writeable = False
+
+    return offsets, data
+
+
 # THIS IS THE POINT WHERE THE PENTATONIC LIST HAS TO HAPPEN? 
 def get_KP_list_for_notegroup(notegroup, pentatonic=False):
     '''
@@ -344,9 +448,15 @@ def KP_list_to_KPDVE_list(kp_list, notegroup, v_opt=0):
     '''
 
     kpdve_list = kp_list.copy()
+    notegroups_cM = undo_KP_to_analyze_array(notegroup, kpdve_list[:, 0], kpdve_list[:, 1])
 
-    for kp in kpdve_list:
-        kp += DVE_vals_for_CM_notegroup(undo_KP_to_analyze(notegroup, kp[0], kp[1]), v_opt)
+    # (a KP that does not hold the notegroup leaves notes outside C Major: search those)
+    if (notegroups_cM & ~pt_utils.C_M_FIFTHS).any():
+        for kp in kpdve_list:
+            kp += DVE_vals_for_CM_notegroup(undo_KP_to_analyze(notegroup, kp[0], kp[1]), v_opt)
+        return kpdve_list
+
+    kpdve_list += DVE_table(v_opt)[notegroups_cM >> 5]
     
     return kpdve_list
 
@@ -373,6 +483,38 @@ def DVE_vals_for_CM_notegroup(notegroup, v_opt=-1):
     array([0, 0, 0, 4, 3])
     '''
 
+    if 0 <= notegroup and (notegroup & ~pt_utils.C_M_FIFTHS) == 0:
+        return DVE_table(v_opt)[notegroup >> 5].astype(int)
+
+    return search_DVE_vals_for_CM_notegroup(notegroup, v_opt)
+
+
+def search_DVE_vals_for_CM_notegroup(notegroup, v_opt=-1, num_steps=None):
+    '''
+    the search behind DVE_table: every note as D, every voicing in v_options[v_opt].
+    fewest steps wins, then lowest D.
+
+    Parameters
+    ----------
+    notegroup : int
+        pitch class set (circle-fifths-based).
+    v_opt : int, optional
+        selects from v_options. The default is -1.
+    num_steps : function, optional
+        (notegroup, d, v) -> steps. The default is num_steps_to_DVE_match_at_D.
+
+    Returns
+    -------
+    np.array(5)
+        ([0,0,d, v_opt ,e])
+
+    >>> search_DVE_vals_for_CM_notegroup(0b110011000000)
+    array([0, 0, 0, 4, 3])
+    '''
+
+    if num_steps is None:
+        num_steps = num_steps_to_DVE_match_at_D
+
     v_vals = v_options[v_opt]
     minsteps = 7
     
@@ -382,7 +524,7 @@ def DVE_vals_for_CM_notegroup(notegroup, v_opt=-1):
 
     for notevalue in pt_utils.bit_locs(notegroup):
         for v_val in v_vals:
-            steps_temp = num_steps_to_DVE_match_at_D(notegroup, notevalue, v_val)
+            steps_temp = num_steps(notegroup, notevalue, v_val)
             if steps_temp < minsteps or (steps_temp == minsteps and notevalue < d):
                 minsteps = steps_temp
                 d = notevalue
@@ -572,6 +714,99 @@ def undo_KP_to_analyze(notegroup, k, p):
     return apply_filter_for_p(notegroup_cM, p)
 
 
+def undo_KP_to_analyze_array(notegroup, k, p):
+    '''
+    undo_KP_to_analyze for arrays of k and p (and one notegroup, or an array of them)
+
+    >>> undo_KP_to_analyze_array(0b111111100000, np.array([0, 11, 0]), np.array([0, 1, 2]))
+    array([4064, 4064, 3048])
+    '''
+
+    notegroups_cM = pt_utils.rotate_bits_left_array(notegroup, k)
+    p_filters = P_FILTERS[p]
+
+    return np.where(notegroups_cM & p_filters == 0, notegroups_cM, notegroups_cM ^ p_filters)
+
+
+# every KP mask, in the order of the search loops (K, then P): index k * 7 + p
+KP_MASKS = np.array([get_binary_KP(k, p) for k in range(pt_utils.MODVALS[0]) for p in range(pt_utils.MODVALS[1])])
+
+
+def KP_match_matrix(notegroups):
+    '''
+    the KP superset test of get_KP_list_for_notegroup, for many notegroups at once
+
+    Parameters
+    ----------
+    notegroups : np.array(n) (int)
+        circle-based pitch-class sets
+
+    Returns
+    -------
+    np.array(n, 84) (bool)
+        True where the notegroup fits inside KP_MASKS[k * 7 + p]
+
+    >>> np.flatnonzero(KP_match_matrix(np.array([0b101100100101]))[0])
+    array([67])
+    '''
+
+    notegroups = np.asarray(notegroups, dtype=int)
+    return (notegroups[:, np.newaxis] | KP_MASKS) == KP_MASKS
+
+
+# the XOR filter used by apply_filter_for_p for each p (none for 0)
+P_FILTERS = np.array([0] + [get_binary_P(conventional_p_filter_index(p)) for p in range(1, pt_utils.MODVALS[1])])
+
+# DVE_TOWERS[d, v, e] == get_binary_DVE_chord(d, v, e): every tower in C Major space
+DVE_TOWERS = np.array([[[get_binary_DVE_chord(d, v, e) for e in range(7)] for v in range(7)] for d in range(7)])
+
+_DVE_TABLES = {}
+
+
+def DVE_table(v_opt=-1):
+    '''
+    [0, 0, D, V, E] for each of the 128 notegroups inside C Major (0b1111111 << 5), 
+    indexed by notegroup >> 5: the DVE search done once per v_opt
+
+    Parameters
+    ----------
+    v_opt : int, optional
+        selects from v_options. The default is -1.
+
+    Returns
+    -------
+    np.array(128, 5) (int8), read-only
+
+    >>> DVE_table()[0b110011000000 >> 5]
+    array([0, 0, 0, 4, 3], dtype=int8)
+    '''
+
+    v_opt = v_opt % len(v_options)
+
+    if v_opt not in _DVE_TABLES:
+        table = np.array([search_DVE_vals_for_CM_notegroup(ng_index << 5, v_opt, num_steps=tower_steps_to_DVE_match_at_D) 
+                          for ng_index in range(128)], dtype=np.int8)
+        table.flags.writeable = False
+        _DVE_TABLES[v_opt] = table
+
+    return _DVE_TABLES[v_opt]
+
+
+def tower_steps_to_DVE_match_at_D(notegroup, d, v=4):
+    '''
+    num_steps_to_DVE_match_at_D, read from DVE_TOWERS (notegroup inside C Major)
+
+    >>> tower_steps_to_DVE_match_at_D(0b101011000000, 0, 4)
+    4
+    '''
+
+    contains = (DVE_TOWERS[d, v] & notegroup) == notegroup
+
+    # the tower stops growing after 7 steps
+    return int(np.argmax(contains)) if contains.any() else 7
+
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
\ No newline at end of file
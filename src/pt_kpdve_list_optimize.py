@@ -2,7 +2,6 @@
 # A SITE FOR FURTHER RESEARCH. FOR NOW IT FUNCTIONS
 
 import numpy as np
-from operator import itemgetter
 
 import pt_utils
 
@@ -26,9 +25,11 @@ EARTH_MOVE_APPROX = ([7.0, 3.0, 3.0, 1.0, 1.0])
 
 CURRENT_WEIGHTS = SLIGHT_PREFERENCE
 
+HALF_MODVALS = pt_utils.MODVALS / 2
+
 # try to stay in numpy for this. it chould come in handy
 
-def closest_kpdve(kpdve_list, landmark):
+def closest_kpdve(kpdve_list, landmark, weights=None):
     '''
     
     Parameters
@@ -37,6 +38,8 @@ def closest_kpdve(kpdve_list, landmark):
         a list of numpy arrays of form KPDVE
     landmark : a numpy array (5)
         an array from whose location distances are measured.
+    weights : np.array(5), optional
+        distance weights. The default is CURRENT_WEIGHTS.
 
     Returns
     -------
@@ -53,23 +56,67 @@ def closest_kpdve(kpdve_list, landmark):
     if len(kpdve_list) == 0:
         return landmark ## assume no effect
 
-    new_list = []
-    for a_kpdve in kpdve_list:
-        # if there's kpd match -- this is okay but a bit sub-optimal... what if another voicing gives a better, more efficient analysis?
-        # then you'd have to lop through the voicings and compare... would be more stable
-        if a_kpdve[0] == landmark[0] and a_kpdve[1] == landmark[1] and a_kpdve[2] == landmark[2]:
-            new_list.append(np.array(a_kpdve))
-        elif a_kpdve[0] == landmark[0] and a_kpdve[1] == landmark[1]:
-            new_list.append(np.array(a_kpdve))
-        elif a_kpdve[0] == landmark[0]:
-            new_list.append(np.array(a_kpdve))
-    
-    if len(new_list) >= 1:
-        return np.array(sort_by_mod_distance(new_list, landmark)[0])
-    
-    return np.array(sort_by_mod_distance(kpdve_list, landmark)[0])
-    
-    
+    kpdve_a = np.asarray(kpdve_list)
+    distances = weighted_kpdve_distances(kpdve_a, landmark, weights)
+
+    # the KPD, KP and K matches are all K matches, kept in list order:
+    # if there are any, the closest of them wins
+    k_match = kpdve_a[:, 0] == landmark[0]
+    if k_match.any():
+        distances = np.where(k_match, distances, np.inf)
+
+    # argmin takes the first of equal distances, as the stable sort did
+    return np.array(kpdve_a[np.argmin(distances)], dtype=int)
+
+
+def closest_kpdve_batch(offsets, candidates, landmarks):
+    '''
+    closest_kpdve for many frames at once, each frame with its own landmark
+
+    Parameters
+    ----------
+    offsets : np.array(n + 1) (int)
+        the candidates for frame i are candidates[offsets[i]:offsets[i+1]]
+    candidates : np.array(offsets[-1], 5)
+        ragged candidate lists, e.g. from partita.analyze_binary_note_input_batch
+    landmarks : np.array(n, 5)
+        one landmark per frame
+
+    Returns
+    -------
+    np.array(n, 5)
+        the closest candidate for each frame (its landmark, if the frame is empty)
+
+    >>> closest_kpdve_batch(np.array([0, 2, 2, 5]), 
+    ...                     np.array([[0,4,0,6,0], [0,0,0,1,1], [11,4,6,3,1], [6,5,0,5,3], [0,0,0,1,1]]),
+    ...                     np.array([[0,0,0,0,0], [1,1,1,1,1], [5,4,0,5,3]]))
+    array([[0, 0, 0, 1, 1],
+           [1, 1, 1, 1, 1],
+           [6, 5, 0, 5, 3]])
+    '''
+
+    landmarks = np.asarray(landmarks, dtype=int)
+    counts = np.diff(offsets)
+    frame_of = np.repeat(np.arange(counts.shape[0]), counts)
+    frame_landmarks = landmarks[frame_of]
+
+    distances = weighted_kpdve_distances(candidates, frame_landmarks)
+
+    # same preference as closest_kpdve: K matches first, where a frame has any
+    k_match = candidates[:, 0] == frame_landmarks[:, 0]
+    frame_has_k = np.bincount(frame_of[k_match], minlength=counts.shape[0]) > 0
+    distances = np.where(k_match | ~frame_has_k[frame_of], distances, np.inf)
+
+    # stable sort by frame, then distance: the first entry of each frame is its closest
+    order = np.lexsort((distances, frame_of))
+    filled = counts > 0
+
+    result = landmarks.copy()
+    result[filled] = candidates[order[offsets[:-1][filled]]]
+
+    return result
+
+
 def sort_by_mod_distance(kpdve_list, landmark):
     '''
     
@@ -95,17 +142,104 @@ def sort_by_mod_distance(kpdve_list, landmark):
 
     if len(kpdve_list) == 0:
         return  np.array([pt_utils.MODVALS])
-    param = 0
-    new_list = []
-    for a_kpdve in kpdve_list:
-        new_list.append([a_kpdve, weighted_kpdve_distance(a_kpdve, 
-                                                          landmark, 
-                                                          CURRENT_WEIGHTS)])
-        param += 1
 
-    sorted_array = np.array(sorted(new_list, key=itemgetter(1)), dtype=object)
+    order = np.argsort(weighted_kpdve_distances(np.asarray(kpdve_list), landmark), kind='stable')
+
+    sorted_array = np.empty(len(order), dtype=object)
+    for i, idx in enumerate(order):
+        sorted_array[i] = kpdve_list[idx]
+
+    return sorted_array
+
+
+def weighted_kpdve_distances(kpdve_a, landmark, weights=None):
+    '''
+    weighted_kpdve_distance for a whole array of kpdve values at once
+
+    Parameters
+    ----------
+    kpdve_a : np.array(n, 5)
+        harmonic locations
+    landmark : np.array(5) or np.array(n, 5)
+        the location(s) distances are measured from
+    weights : np.array(5), optional
+        a set of weights to change distance. The default is CURRENT_WEIGHTS.
+
+    Returns
+    -------
+    np.array(n) (float)
+        weighted distance in modular space from each row to the landmark
+
+    >>> weighted_kpdve_distances(np.array([[0,0,0,4,3], [1,0,0,4,3]]), np.array([0,0,0,4,3]), SAME_WEIGHTS)
+    array([0., 1.])
+    '''
+
+    if weights is None:
+        weights = CURRENT_WEIGHTS
+
+    diff = np.abs(np.asarray(kpdve_a, dtype=int) - landmark)
+    weighted = np.where(diff < HALF_MODVALS, diff, pt_utils.MODVALS - diff) * weights
+
+    # np.linalg.norm(weighted, axis=-1), without its call overhead
+    return np.sqrt(np.add.reduce(weighted * weighted, axis=-1))
+
+
+def viterbi_kpdve_path(offsets, candidates, start_kpdve, weights=None):
+    '''
+    the path through per-frame candidate lists with the least total weighted 
+    distance (start_kpdve to frame 0, then frame to frame): a global 
+    alternative to choosing closest_kpdve frame by frame.
+
+    Parameters
+    ----------
+    offsets : np.array(n + 1) (int)
+        the candidates for frame i are candidates[offsets[i]:offsets[i+1]] (none empty)
+    candidates : np.array(offsets[-1], 5)
+        ragged candidate lists, e.g. from partita.analyze_binary_note_input_batch
+    start_kpdve : np.array(5)
+        where the path starts (before frame 0)
+    weights : np.array(5), optional
+        distance weights. The default is CURRENT_WEIGHTS.
+
+    Returns
+    -------
+    np.array(n, 5) (int)
+        one candidate per frame
+
+    closest_kpdve would take the first of two equal choices at frame 0; the path looks ahead
+    >>> viterbi_kpdve_path(np.array([0, 2, 3]), np.array([[1,0,0,4,3], [11,0,0,4,3], [10,0,0,4,3]]), np.array([0,0,0,4,3]))
+    array([[11,  0,  0,  4,  3],
+           [10,  0,  0,  4,  3]])
+    '''
+
+    frame_count = offsets.shape[0] - 1
+    if frame_count == 0:
+        return np.zeros((0, 5), dtype=int)
+
+    candidates = np.asarray(candidates, dtype=int)
+    back = np.zeros(offsets[-1], dtype=int)
+
+    # cost of the best path ending at each candidate of the current frame
+    prev = candidates[offsets[0]:offsets[1]]
+    cost = weighted_kpdve_distances(prev, start_kpdve, weights)
+
+    for t in range(1, frame_count):
+        current = candidates[offsets[t]:offsets[t + 1]]
+        total = cost[:, np.newaxis] + weighted_kpdve_distances(prev[:, np.newaxis, :], current[np.newaxis, :, :], weights)
+
+        best_prev = np.argmin(total, axis=0)
+        cost = total[best_prev, np.arange(current.shape[0])]
+        back[offsets[t]:offsets[t + 1]] = best_prev
+        prev = current
+
+    # follow the back pointers from the cheapest end
+    path = np.zeros((frame_count, 5), dtype=int)
+    choice = np.argmin(cost)
+    for t in range(frame_count - 1, -1, -1):
+        path[t] = candidates[offsets[t] + choice]
+        choice = back[offsets[t] + choice]
 
-    return sorted_array[:, 0]
+    return path
 
 
 def mod_distance(val1, val2, mod):
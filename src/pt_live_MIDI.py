@@ -16,27 +16,211 @@ from harmony_state import harmony_state
 from collections import deque
 
 import time
+import threading
 
 import numpy as np
 import pt_utils
 
-import pt_live_graph
+import pt_live_shm
 
 
 class midi_note_pitchclass_collector():
-    pclass_count = np.zeros(12, dtype=int)
-    current_notegroup = 0
+    '''
+    the pitch classes sounding on one instrument, as a notegroup
+
+    Each collector is independent (one per port, channel or player). Each pitch class
+    counts the notes sounding it, so the notegroup changes by one bit op, only when a
+    count moves from or to 0. With the sustain pedal down, released notes keep sounding
+    until it comes up.
+
+    >>> c = midi_note_pitchclass_collector()
+    >>> c.add_note(60), c.add_note(64), c.add_note(72)
+    (True, True, False)
+    >>> bin(c.current_notegroup)
+    '0b100010000000'
+    >>> c.remove_note(60), c.current_notegroup == 0b100010000000
+    (False, True)
+
+    with the pedal down, released notes stay until it comes up
+    >>> c.set_sustain(True)
+    False
+    >>> c.remove_note(64), c.remove_note(72), bin(c.current_notegroup)
+    (False, False, '0b100010000000')
+    >>> c.set_sustain(False), c.current_notegroup
+    (True, 0)
+    '''
+
+    __slots__ = ('pclass_count', 'current_notegroup', 'keys_down', 'sustain', 'sustained')
+
+    def __init__(self):
+        self.pclass_count = [0] * 12        # notes sounding each pitch class
+        self.current_notegroup = 0
+        self.keys_down = [False] * 128
+        self.sustain = False
+        self.sustained = set()              # released notes held by the pedal
+
 
     def add_note(self, midi_note):
-        self.pclass_count[midi_note % 12] += 1
-        self.current_notegroup = pt_utils.numpy_array_to_binary_notegroup(self.pclass_count)
+        '''
+        a key goes down; True if the notegroup changed
+        '''
+
+        if self.keys_down[midi_note]:
+            return False
+        self.keys_down[midi_note] = True
+
+        if midi_note in self.sustained:     # restruck under the pedal: already sounding
+            self.sustained.discard(midi_note)
+            return False
+
+        return self._sound(midi_note % 12)
+
 
     def remove_note(self, midi_note):
-        if (self.pclass_count[midi_note % 12] > 0):
-            self.pclass_count[midi_note % 12] -= 1
-            self.current_notegroup = pt_utils.numpy_array_to_binary_notegroup(self.pclass_count)
+        '''
+        a key comes up; True if the notegroup changed
+        '''
+
+        if not self.keys_down[midi_note]:
+            return False
+        self.keys_down[midi_note] = False
+
+        if self.sustain:
+            self.sustained.add(midi_note)
+            return False
+
+        return self._silence(midi_note % 12)
+
+
+    def set_sustain(self, down):
+        '''
+        the pedal goes down or up; True if the notegroup changed
+        '''
+
+        self.sustain = down
+        if down or not self.sustained:
+            return False
+
+        before = self.current_notegroup
+        for midi_note in self.sustained:
+            self._silence(midi_note % 12)
+        self.sustained.clear()
+
+        return self.current_notegroup != before
+
+
+    def reset(self):
+        self.__init__()
+
+
+    def _sound(self, pclass):
+        self.pclass_count[pclass] += 1
+        if self.pclass_count[pclass] == 1:
+            self.current_notegroup |= pt_utils.LEFT_BIT >> pclass
+            return True
+        return False
+
+
+    def _silence(self, pclass):
+        self.pclass_count[pclass] -= 1
+        if self.pclass_count[pclass] == 0:
+            self.current_notegroup &= ~(pt_utils.LEFT_BIT >> pclass)
+            return True
+        return False
+
+
+
+class midi_burst_listener():
+    '''
+    a mido input callback that gathers messages into bursts
+
+    A chord played arrives as several note messages within a millisecond or two:
+    wait_burst hands them over together, once no message has come for coalesce_s
+    (or max_wait_s after the first, so a steady stream still gets through).
+    Only the analysis waits: with an outport, note messages are passed through
+    the moment they arrive.
+
+        listener = midi_burst_listener(outport=outport)
+        inport = mido.open_input(name, callback=listener)
+        burst = listener.wait_burst()     # [(arrival time, msg), ...]
+    '''
+
+    # messages that say nothing about harmony
+    IGNORED_TYPES = ("clock", "active_sensing", "start", "stop", "continue", "songpos", "aftertouch", "polytouch")
+
+    # messages passed through to the outport
+    FORWARDED_TYPES = ("note_on", "note_off")
+
+    def __init__(self, coalesce_s=0.002, max_wait_s=0.010, latency_frames=1024, outport=None):
+        self.coalesce_s = coalesce_s
+        self.max_wait_s = max_wait_s
+        self.outport = outport
+
+        self.pending = deque()
+        self.arrived = threading.Event()
+
+        self.messages = 0
+        self.bursts = 0
+        self.latencies = deque(maxlen=latency_frames)
 
 
+    def __call__(self, msg):
+        # runs on mido's thread: pass notes through, note the time, queue, wake the reader
+        if self.outport is not None and msg.type in self.FORWARDED_TYPES:
+            self.outport.send(msg)
+
+        if msg.type not in self.IGNORED_TYPES:
+            self.pending.append((time.perf_counter(), msg))
+            self.arrived.set()
+
+
+    def wait_burst(self, timeout=None):
+        '''
+        the next burst of messages, oldest first; [] if nothing came within timeout
+        '''
+
+        self.arrived.clear()
+        if not self.pending and not self.arrived.wait(timeout):
+            return []
+
+        # let the rest of the burst arrive
+        first = self.pending[0][0]
+        while True:
+            count = len(self.pending)
+            time.sleep(self.coalesce_s)
+            if len(self.pending) == count or time.perf_counter() - first >= self.max_wait_s:
+                break
+
+        burst = []
+        while self.pending:
+            burst.append(self.pending.popleft())
+
+        self.messages += len(burst)
+        self.bursts += 1
+        return burst
+
+
+    def analyzed(self, burst):
+        '''
+        note that burst has been analyzed: its latency is from its first message to now
+        '''
+        if burst:
+            self.latencies.append(time.perf_counter() - burst[0][0])
+
+
+    def latency_stats(self):
+        '''
+        event-to-analysis latency (ms) over recent bursts, and messages per burst
+        '''
+
+        stats = {"messages": self.messages, "bursts": self.bursts,
+                 "messages_per_burst": self.messages / self.bursts if self.bursts else 0.0}
+        if self.latencies:
+            times = np.array(self.latencies) * 1e3
+            stats.update({"mean_ms": float(times.mean()), "p95_ms": float(np.percentile(times, 95)), "max_ms": float(times.max())})
+
+        return stats
+
 
 def play_current_kpdve(outport, current_state):
     for e in current_state.current_kpdve_notes():
@@ -85,63 +269,101 @@ def ask_in_out_ports():
     return inport, outport
 
 
-def analyze_midi_piano_input():
-    inport, outport = ask_in_out_ports()
+def apply_midi_message(msg, p_classes, current_state):
+    '''
+    note messages change p_classes; control changes move the state directly
 
-    p_classes = midi_note_pitchclass_collector()
-    
-    current_state = harmony_state() 
-    graph_window = pt_live_graph.live_harmony_graph(current_state)
+    Returns
+    -------
+    (notegroup_changed, harmony_changed)
+    '''
 
-    msglog = deque()
-    
-    while True:
-        msg = inport.receive()
+    if (msg.type == "note_on"):
+        if msg.velocity > 0:
+            return p_classes.add_note(msg.note), False
+        else:
+            return p_classes.remove_note(msg.note), False
 
-        change_harmony = False
-        print(msg) ### find out what sort of a thing this is...
+    elif (msg.type == "note_off"):
+        return p_classes.remove_note(msg.note), False
 
-        if (msg.type == "note_on"):
-            if msg.velocity > 0:
-                p_classes.add_note(msg.note)
-            else:
-                p_classes.remove_note(msg.note)
-                
-            print(p_classes.pclass_count)
+    elif (msg.type == "control_change"):
+        if (msg.control == 64): # sustain pedal
+            return p_classes.set_sustain(msg.value >= 64), False
+        elif (msg.control == 1): # joystick:1
+            if(msg.value == 0):
+                return False, current_state.param_increment(1, 1)
+            elif (msg.value == 127):
+                return False, current_state.param_increment(1, -1)
 
-            change_harmony = current_state.change_notegroup(p_classes.current_notegroup)
+    elif (msg.type == "pitchwheel"):
+        if msg.pitch == -8192:
+            return False, current_state.param_increment(2, -1)
+        elif msg.pitch == 8191:
+            return False, current_state.param_increment(2, 1)
 
-            msglog.append({"msg": msg, "due": time.time()})
+    return False, False
 
-            print(current_state.current_root_string() + " as " + current_state.current_function_string() + " of " + current_state.current_conv_tonic_string() + " " + current_state.current_conv_pattern_string())
 
+def analyze_midi_piano_input(coalesce_s=0.002, display="window", shm_name=pt_live_shm.DEFAULT_NAME):
+    '''
+    analyze a MIDI keyboard live: each burst of messages (e.g. a chord) is one analysis
 
-        elif (msg.type == "note_off"):   
-            p_classes.remove_note(msg.note)
-            print(p_classes.pclass_count)
+    Parameters
+    ----------
+    coalesce_s : float
+        how long the input must be quiet before a burst is analyzed
+    display : str
+        "window" or "shm" (see pt_live_shm.open_display)
+    '''
 
-            change_harmony = current_state.change_notegroup(p_classes.current_notegroup)
+    inport, outport = ask_in_out_ports()
 
-        elif (msg.type == "control_change"):
-            if (msg.control == 1): # joystick:1
-                if(msg.value == 0):
-                    change_harmony = current_state.param_increment(1, 1)
-                elif (msg.value == 127):
-                    change_harmony = current_state.param_increment(1, -1)
-        
-        elif (msg.type == "pitchwheel"):
-            if msg.pitch == -8192:
-                change_harmony = current_state.param_increment(2, -1)
-            elif msg.pitch == 8191:
-                change_harmony = current_state.param_increment(2, 1)
+    listener = midi_burst_listener(coalesce_s=coalesce_s, outport=outport)
+    inport.callback = listener
 
-        while len(msglog) > 0 and msglog[0]["due"] <= time.time():
-            outport.send(msglog.popleft()["msg"])
+    p_classes = midi_note_pitchclass_collector()
+    
+    current_state = harmony_state() 
 
-        if (change_harmony == True):
-            graph_window.update_window_for_state()
+    graph_window, publisher, viewer = pt_live_shm.open_display(display, current_state, shm_name)
+    wait_s = graph_window.min_interval if graph_window is not None else 0.1
 
-        time.sleep(0.001)
+    while True:
+        try:
+            burst = listener.wait_burst(timeout=wait_s)
+            if burst:
+                notes_changed = False
+                change_harmony = False
+                for arrival, msg in burst:
+                    notes, harmony = apply_midi_message(msg, p_classes, current_state)
+                    notes_changed |= notes
+                    change_harmony |= harmony
+
+                # one analysis for the whole burst
+                if notes_changed:
+                    change_harmony |= current_state.change_notegroup(p_classes.current_notegroup)
+
+                listener.analyzed(burst)
+
+                if (change_harmony == True):
+                    if publisher is not None:
+                        publisher.publish(current_state)
+                    print(current_state.current_root_string() + " as " + current_state.current_function_string() + " of " + current_state.current_conv_tonic_string() + " " + current_state.current_conv_pattern_string())
+                    if graph_window is not None:
+                        graph_window.update_window_for_state()
+
+            # draws the latest state at most max_fps times a second
+            if graph_window is not None:
+                graph_window.service()
+
+        except KeyboardInterrupt:
+            inport.close()
+            outport.close()
+            pt_live_shm.close_display(publisher, viewer)
+            print("event to analysis:", listener.latency_stats())
+            print("process killed")
+            quit()
 
         
 if __name__ == "__main__":
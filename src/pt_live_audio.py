@@ -9,67 +9,245 @@ Created on Mon Jun  1 22:40:10 2020
 
 import pyaudio
 import sys
+import copy
+import threading
 import numpy as np
-import librosa
-import matplotlib.pyplot as plt
 
-from time import process_time
+from collections import deque
 
-import pt_analyzeaudio
+import pt_live_chroma
+import pt_live_shm
 import pt_naming_conventions
 import pt_keypattern
 import pt_utils
 import harmony_state
 
-import pt_live_graph
+# FFT - Chroma params: a transform over N_FFT samples every HOP_LENGTH samples
+N_FFT = 4096
+HOP_LENGTH = 512
 
-# FFT - Chroma params:
-N_FFT = 1024
-HOP_LENGTH = 256
+# what the capture queue does when analysis falls behind
+DROP_OLDEST = "drop_oldest"     # a full queue discards its oldest block for the new one
+DROP_NEWEST = "drop_newest"     # a full queue refuses the new block
+LATEST_ONLY = "latest"          # analysis skips straight to the newest block, whatever waits
+
+
+# =============================================================================
+# CAPTURE -> ANALYSIS
+# =============================================================================
+
+class audio_frame_queue():
+    '''
+    a bounded queue of sample blocks from the capture callback to the analysis thread
+
+    deque.append and deque.popleft are atomic, so the capture side never takes a lock
+    and never waits: when the queue is full, a block is dropped (see the policies above).
+    Only the capture side counts drops and only the analysis side counts skips.
+    '''
+
+    def __init__(self, maxlen=8, policy=DROP_OLDEST):
+        if policy not in (DROP_OLDEST, DROP_NEWEST, LATEST_ONLY):
+            raise ValueError(f"unknown drop policy: {policy}")
+
+        self.blocks = deque()
+        self.maxlen = maxlen
+        self.policy = policy
+        self.available = threading.Event()
+
+        self.pushed = 0         # blocks captured
+        self.dropped = 0        # blocks lost to a full queue
+        self.skipped = 0        # blocks passed over as stale (LATEST_ONLY)
+        self.overflows = 0      # input overflows reported by PortAudio
+        self.max_depth = 0
+
+
+    def put(self, block):
+        '''
+        (capture side) add a block; False if it was dropped
+        '''
+
+        self.pushed += 1
+        if len(self.blocks) >= self.maxlen:
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                return False
+            try:
+                self.blocks.popleft()
+            except IndexError:  # analysis emptied it meanwhile
+                pass
+
+        self.blocks.append(block)
+        self.max_depth = max(self.max_depth, len(self.blocks))
+        self.available.set()
+        return True
+
+
+    def get(self, timeout=None):
+        '''
+        (analysis side) the blocks to analyze, oldest first: [] if none came within timeout
+        '''
+
+        self.available.clear()
+        if not self.blocks:
+            self.available.wait(timeout)
+
+        taken = []
+        while self.blocks:
+            taken.append(self.blocks.popleft())
+
+        if self.policy == LATEST_ONLY and len(taken) > 1:
+            self.skipped += len(taken) - 1
+            taken = taken[-1:]
+
+        return taken
+
+
+    def depth(self):
+        return len(self.blocks)
+
+
+    def counters(self):
+        return {"pushed": self.pushed, "dropped": self.dropped, "skipped": self.skipped,
+                "overflows": self.overflows, "depth": self.depth(), "max_depth": self.max_depth}
+
+
+class audio_analysis_worker(threading.Thread):
+    '''
+    takes blocks from an audio_frame_queue, makes chroma and changes the harmony state
+
+    changes happen under state_lock; changed is set after each one, for whoever displays them.
+    With a publisher (pt_live_shm), every analyzed frame is published from this thread.
+    '''
+
+    def __init__(self, frame_queue, chroma_engine, current_state, threshold=0.5, max_notes=5, v_opt=0, publisher=None):
+        super().__init__(daemon=True)
+        self.frame_queue = frame_queue
+        self.chroma_engine = chroma_engine
+        self.current_state = current_state
+        self.threshold = threshold
+        self.max_notes = max_notes
+        self.v_opt = v_opt
+        self.publisher = publisher
+
+        self.state_lock = threading.Lock()
+        self.changed = threading.Event()
+        self.stopping = threading.Event()
+
+
+    def run(self):
+        while not self.stopping.is_set():
+            frames = []
+            for block in self.frame_queue.get(timeout=0.1):
+                frames.extend(self.chroma_engine.push(block))
+
+            # the smoothed chroma already includes the earlier frames: only the newest matters
+            if frames:
+                C_mean = frames[-1]
+
+                # can I 'juice' the signal with tonality (resonance) here?
+
+                with self.state_lock:
+                    change = self.current_state.change_from_chroma(C_mean, threshold=self.threshold, max_notes=self.max_notes, v_opt=self.v_opt)
+                if self.publisher is not None:
+                    self.publisher.publish(self.current_state)
+                if change:
+                    self.changed.set()
+
+
+    def snapshot(self):
+        '''
+        a copy of the harmony state that analysis will not change underneath its reader
+        '''
+        with self.state_lock:
+            return copy.copy(self.current_state)
+
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+
+
+def analyze_audio_in(buffer_size=HOP_LENGTH, sr=22050, smoothing=0.5, queue_length=8, policy=DROP_OLDEST, display="window",
+                     shm_name=pt_live_shm.DEFAULT_NAME):
+    '''
+    analyze the default input live; the input is passed through to the output
+
+    PortAudio's callback queues each block (it never waits on analysis), a worker thread
+    analyzes them, and this thread only prints and redraws (capped by the graph's frame rate).
+
+    Parameters
+    ----------
+    buffer_size : int
+        samples per captured block
+    sr : int
+        sample rate
+    smoothing : float
+        see pt_live_chroma.live_chroma
+    queue_length : int
+        blocks that may wait for analysis (queue_length * buffer_size / sr seconds of latency at most)
+    policy : str
+        DROP_OLDEST, DROP_NEWEST or LATEST_ONLY: what to lose when analysis falls behind
+    display : str
+        "window": a graph in this process. "shm": publish to shared memory (shm_name) and
+        start a viewer process; more viewers can attach with `python pt_live_shm.py`
+    '''
+
+    # chroma one hop at a time, smoothed as it goes
+    chroma_engine = pt_live_chroma.live_chroma(sr=sr, n_fft=N_FFT, hop_length=HOP_LENGTH, smoothing=smoothing)
+    frame_queue = audio_frame_queue(queue_length, policy)
+
+    # Harmony State
+    current_state = harmony_state.harmony_state()
+
+    graph_window, publisher, viewer = pt_live_shm.open_display(display, current_state, shm_name)
+    wait_s = graph_window.min_interval if graph_window is not None else 0.1
+
+    worker = audio_analysis_worker(frame_queue, chroma_engine, current_state, publisher=publisher)
+
+    def capture(in_data, frame_count, time_info, status):
+        if status & pyaudio.paInputOverflow:
+            frame_queue.overflows += 1
+        frame_queue.put(np.frombuffer(in_data, dtype=np.float32))
+        return (in_data, pyaudio.paContinue)
 
-def analyze_audio_in(buffer_size=2048, sr=22050):
     #init pyaudio
     p = pyaudio.PyAudio()
 
     #open stream
-    buffer_size = buffer_size
     pyaudio_format = pyaudio.paFloat32
     stream = p.open(format=pyaudio_format,
                     channels=1,
                     rate=sr,
                     input=True,
                     output=True,
-                    frames_per_buffer=buffer_size)
+                    frames_per_buffer=buffer_size,
+                    stream_callback=capture)
 
-    # Harmony State
-    current_state = harmony_state.harmony_state()
-    graph_window = pt_live_graph.live_harmony_graph(current_state)
+    worker.start()
+    stream.start_stream()
 
+    # tkinter and matplotlib stay on this thread
     while True:
         try:
-            data = stream.read(buffer_size, exception_on_overflow=False)
-            samples = np.frombuffer(data, dtype=float)
-    
-            # S = np.abs(librosa.stft(samples, n_fft=N_FFT))**2
-            # C = librosa.feature.chroma_stft(S=S, sr=sr, hop_length=HOP_LENGTH)
-
-            C = librosa.feature.chroma_cqt(y=samples, sr=sr)
-
-            C = np.minimum(C, librosa.decompose.nn_filter(C, aggregate=np.mean, metric='cosine'))
-            C_mean = np.mean(C, axis=1)
-
-            # can I 'juice' the signal with tonality (resonance) here?
+            if worker.changed.wait(timeout=wait_s):
+                worker.changed.clear()
+                snapshot = worker.snapshot()
+                show_terminal_output(snapshot)
+                if graph_window is not None:
+                    graph_window.update_window_for_state(snapshot)
 
-            if (current_state.change_from_chroma(C_mean, threshold=0.5, max_notes=5, v_opt=0)):
-                show_terminal_output(current_state)
-                graph_window.update_window_for_state()
+            # draws the latest snapshot at most max_fps times a second
+            if graph_window is not None:
+                graph_window.service()
 
-            stream.write(data)
-            
         except  KeyboardInterrupt:
             stream.stop_stream()
             stream.close()
             p.terminate()
+            worker.stop()
+            pt_live_shm.close_display(publisher, viewer)
+            print("chroma per frame:", chroma_engine.timing())
+            print("capture queue:", frame_queue.counters())
             print("process killed")
             quit()
 
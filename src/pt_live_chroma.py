@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Live chroma, one hop at a time.
+
+Incoming samples go into a ring buffer of n_fft samples. Every hop_length new
+samples, the buffer (oldest first) is windowed, transformed once, and folded
+into twelve pitch classes with precomputed weights. Each chroma frame is mixed
+into a running (exponentially) smoothed chroma, which is what is emitted.
+Each frame's compute time is kept, so the budget per hop can be measured
+against the hop's duration.
+
+    engine = live_chroma(sr=22050, n_fft=2048, hop_length=512)
+    for chroma in engine.push(samples):   # 0 or more frames per call
+        ...
+    print(engine.timing())
+"""
+
+import time
+from collections import deque
+
+import numpy as np
+
+
+# A4 = 440 Hz; C is pitch class 0
+C0_FREQ = 440.0 * 2 ** (-4.75)
+
+
+def pitch_class_weights(sr=22050, n_fft=2048, fmin=55.0, fmax=5000.0, tuning=0.0):
+    '''
+    a (12, n_fft // 2 + 1) matrix folding a power spectrum into chroma:
+    each bin between fmin and fmax counts toward the pitch classes within a
+    semitone of its frequency, linearly less the further away
+
+    Parameters
+    ----------
+    tuning : float
+        offset from A440 in fractions of a semitone
+
+    >>> w = pitch_class_weights(sr=22050, n_fft=4096)
+    >>> w.shape
+    (12, 2049)
+
+    the bin nearest 440 Hz counts toward A (9)
+    >>> int(np.argmax(w[:, round(440 * 4096 / 22050)]))
+    9
+    '''
+
+    freqs = np.arange(n_fft // 2 + 1) * sr / n_fft
+    in_range = (freqs >= fmin) & (freqs <= fmax)
+
+    semitones = np.zeros_like(freqs)
+    semitones[in_range] = 12 * np.log2(freqs[in_range] / C0_FREQ) - tuning
+
+    # distance from each bin to each pitch class, wrapped into [-6, 6)
+    distance = (semitones[np.newaxis, :] - np.arange(12)[:, np.newaxis] + 6) % 12 - 6
+    weights = np.maximum(0.0, 1.0 - np.abs(distance)) * in_range
+
+    return weights
+
+
+class live_chroma():
+    '''
+    a streaming chroma front end: push samples, get smoothed chroma frames
+    '''
+
+    def __init__(self, sr=22050, n_fft=2048, hop_length=512, smoothing=0.5, fmin=55.0, fmax=5000.0, tuning=0.0,
+                 timing_frames=1024):
+        '''
+        Parameters
+        ----------
+        sr : int
+            sample rate of the input
+        n_fft : int
+            samples per transform (the ring buffer size)
+        hop_length : int
+            new samples between frames
+        smoothing : float
+            0 - 1: the weight of the previous smoothed chroma in each new frame
+        fmin, fmax, tuning :
+            see pitch_class_weights
+        timing_frames : int
+            how many recent frame times to keep
+        '''
+
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.smoothing = smoothing
+
+        self.ring = np.zeros(n_fft, dtype=np.float32)
+        self.position = 0          # where the next sample goes (== the oldest sample)
+        self.since_frame = 0       # samples since the last frame
+
+        self.window = np.hanning(n_fft).astype(np.float32)
+        self.weights = pitch_class_weights(sr, n_fft, fmin, fmax, tuning)
+        self.chroma = np.zeros(12)
+
+        self.frame_times = deque(maxlen=timing_frames)
+        self.frames = 0
+
+
+    def push(self, samples):
+        '''
+        add samples (any length); returns the smoothed chroma for each hop completed
+
+        Returns
+        -------
+        list of np.array(12)
+        '''
+
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        emitted = []
+
+        start = 0
+        while start < len(samples):
+            # write up to the next frame boundary (and never past the ring's end)
+            count = min(len(samples) - start, self.hop_length - self.since_frame, self.n_fft - self.position)
+            self.ring[self.position:self.position + count] = samples[start:start + count]
+            self.position = (self.position + count) % self.n_fft
+            self.since_frame += count
+            start += count
+
+            if self.since_frame == self.hop_length:
+                self.since_frame = 0
+                emitted.append(self.compute_frame())
+
+        return emitted
+
+
+    def compute_frame(self):
+        '''
+        the chroma of the ring buffer's contents, mixed into the smoothed chroma
+        '''
+
+        began = time.perf_counter()
+
+        frame = np.concatenate((self.ring[self.position:], self.ring[:self.position]))
+        spectrum = np.abs(np.fft.rfft(frame * self.window)) ** 2
+        chroma = self.weights @ spectrum
+
+        peak = chroma.max()
+        if peak > 0:
+            chroma /= peak
+
+        self.chroma = self.smoothing * self.chroma + (1.0 - self.smoothing) * chroma
+        self.frames += 1
+
+        self.frame_times.append(time.perf_counter() - began)
+        return self.chroma.copy()
+
+
+    def timing(self):
+        '''
+        the compute time per frame against the time between frames
+
+        Returns
+        -------
+        dict
+            frames, mean/p95/max compute (us), hop (ms), load (mean compute / hop)
+        '''
+
+        hop_s = self.hop_length / self.sr
+        if not self.frame_times:
+            return {"frames": self.frames, "hop_ms": hop_s * 1e3}
+
+        times = np.array(self.frame_times)
+        return {"frames": self.frames,
+                "mean_us": times.mean() * 1e6,
+                "p95_us": np.percentile(times, 95) * 1e6,
+                "max_us": times.max() * 1e6,
+                "hop_ms": hop_s * 1e3,
+                "load": times.mean() / hop_s}
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -1,20 +1,17 @@
+import time
 import tkinter
 from tkinter import *
 
-import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg, 
 NavigationToolbar2Tk)
 
-import seaborn as sb
-
 import numpy as np
 from harmony_state import harmony_state
 
 import pt_utils
 import pt_keypattern
 import pt_naming_conventions
-import pt_standardgraph
 
 hue = 0.27
 sat = 1.0
@@ -25,32 +22,116 @@ graphs a heatmap of :
 '''
 
 class live_harmony_graph():
+    '''
+    a window showing the chroma, notegroup and key pattern of a harmony state
+
+    update_window_for_state only notes what to show (the latest state wins, and it may
+    be called from any thread); service(), called from the Tk thread, draws it at most
+    max_fps times a second, blitting just the images that changed over their cached
+    backgrounds.
+    '''
 
-    def __init__(self, ref_state):
+    def __init__(self, ref_state, max_fps=30):
         self.current_state = ref_state
+        self.min_interval = 1.0 / max_fps
+        self.last_draw = 0.0
 
         self.window = tkinter.Tk()
         self.window.wm_title("Representations of Harmonic Process")
 
-        self.fig, self.ax = plt.subplots(4, figsize=(12,3))
+        self.fig = Figure(figsize=(12,3))
+        self.ax = self.fig.subplots(4)
 
-        self.chr_img = self.ax[0].imshow(np.expand_dims(self.current_state.chroma_values, axis=0), vmin=0.0, vmax=1.0)
-        self.ng_img = self.ax[1].imshow(self.heatmap_axis(pt_utils.c_chrom_to_f_circle(self.current_state.current_binary)))
-        self.kp_img = self.ax[2].imshow(self.heatmap_axis(pt_keypattern.get_binary_KP(self.current_state.current_kpdve[0], self.current_state.current_kpdve[1])))
+        self.shown = self.state_data(self.current_state)
+        self.pending = self.shown
+        chroma, notegroup, kp = self.shown
 
-        plt.show(block=False)
+        # animated: left out of full draws, drawn over the cached backgrounds instead
+        self.chr_img = self.ax[0].imshow(np.expand_dims(chroma, axis=0), vmin=0.0, vmax=1.0, animated=True)
+        self.ng_img = self.ax[1].imshow(self.heatmap_axis(notegroup), vmin=0, vmax=1, animated=True)
+        self.kp_img = self.ax[2].imshow(self.heatmap_axis(kp), vmin=0, vmax=1, animated=True)
+        self.images = (self.chr_img, self.ng_img, self.kp_img)
+        self.backgrounds = None
 
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.window)  # A tk.DrawingArea.
+        self.canvas.get_tk_widget().pack(fill=BOTH, expand=True)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
         self.canvas.draw()
 
         self.window.update()
 
 
-    def update_window_for_state(self):
-        self.chr_img.set_data(np.expand_dims(pt_utils.numpy_chrom_to_circle(self.current_state.chroma_values), axis=0))
-        self.ng_img.set_data(self.heatmap_axis(pt_utils.c_chrom_to_f_circle(self.current_state.current_binary)))
-        self.kp_img.set_data(self.heatmap_axis(pt_keypattern.get_binary_KP(self.current_state.current_kpdve[0], self.current_state.current_kpdve[1])))
-        self.fig.canvas.flush_events()
+    def state_data(self, state):
+        '''
+        what the images show of state: (chroma around the circle, notegroup, key pattern)
+        '''
+        kpdve = state.current_kpdve
+        return (pt_utils.numpy_chrom_to_circle(state.chroma_values),
+                pt_utils.c_chrom_to_f_circle(state.current_binary),
+                pt_keypattern.get_binary_KP(kpdve[0], kpdve[1]))
+
+
+    def update_window_for_state(self, state=None):
+        '''
+        show state (by default the state given at construction) at the next service()
+        '''
+        self.pending = self.state_data(self.current_state if state is None else state)
+
+
+    def service(self):
+        '''
+        (on the Tk thread) draw the latest state if one is waiting and a frame is due,
+        then let Tk handle its events
+
+        Returns
+        -------
+        True if it drew
+        '''
+
+        drew = False
+        pending = self.pending
+        now = time.perf_counter()
+
+        if pending is not self.shown and now - self.last_draw >= self.min_interval:
+            self.draw_state(pending)
+            self.last_draw = now
+            drew = True
+
+        self.window.update()
+        return drew
+
+
+    def draw_state(self, data):
+        chroma, notegroup, kp = data
+        changed = []
+
+        if not np.array_equal(chroma, self.shown[0]):
+            self.chr_img.set_data(np.expand_dims(chroma, axis=0))
+            changed.append(0)
+        if notegroup != self.shown[1]:
+            self.ng_img.set_data(self.heatmap_axis(notegroup))
+            changed.append(1)
+        if kp != self.shown[2]:
+            self.kp_img.set_data(self.heatmap_axis(kp))
+            changed.append(2)
+
+        self.shown = data
+
+        if self.backgrounds is None:
+            self.canvas.draw()
+            return
+
+        for i in changed:
+            self.canvas.restore_region(self.backgrounds[i])
+            self.ax[i].draw_artist(self.images[i])
+            self.canvas.blit(self.ax[i].bbox)
+
+
+    def on_draw(self, event):
+        # a full draw (first show, resize): cache the empty axes, then put the images back
+        self.backgrounds = [self.canvas.copy_from_bbox(ax.bbox) for ax in self.ax[:len(self.images)]]
+        for ax, img in zip(self.ax, self.images):
+            ax.draw_artist(img)
 
 
     def heatmap_axis(self, notegroup):
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The live harmony state in shared memory, for viewers in other processes.
+
+The analysis process publishes each state into one small fixed-layout block
+(LIVE_STATE_DTYPE) with a sequence counter; any number of viewer processes
+attach by name and poll it at their display rate. Nothing is ever waited on:
+the writer bumps the counter to odd, writes, and bumps it to even again
+(a seqlock), and a reader that sees an odd counter or a counter that moved
+while it copied simply reads again.
+
+    publisher = live_state_publisher()              # analysis process
+    publisher.publish(current_state)
+
+    python pt_live_shm.py                           # a viewer window (as many as wanted)
+"""
+
+import sys
+import time
+import argparse
+import subprocess
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import pt_keypattern
+
+
+DEFAULT_NAME = "harmonypartition_live"
+
+LIVE_STATE_MAGIC = 0x4B504456   # 'KPDV'
+LIVE_STATE_VERSION = 1          # change with LIVE_STATE_DTYPE
+
+LIVE_STATE_DTYPE = np.dtype([('magic', '<u4'),
+                             ('version', '<u4'),
+                             ('seq', '<u8'),          # odd while the writer is writing
+                             ('time', '<f8'),         # time.time() at publication
+                             ('chroma', '<f4', 12),
+                             ('notegroup', '<u2'),
+                             ('kp_mask', '<u2'),
+                             ('kpdve', 'u1', 5)], align=True)
+
+
+class live_state_snapshot():
+    '''
+    one published state, with the attribute names of harmony_state that
+    pt_live_graph reads (so it can be shown like a harmony_state)
+    '''
+
+    __slots__ = ('seq', 'time', 'chroma_values', 'current_binary', 'kp_mask', 'current_kpdve')
+
+    def __init__(self, record):
+        self.seq = int(record['seq'])
+        self.time = float(record['time'])
+        self.chroma_values = record['chroma'].astype(float)
+        self.current_binary = int(record['notegroup'])
+        self.kp_mask = int(record['kp_mask'])
+        self.current_kpdve = record['kpdve'].astype(int)
+
+
+def _holds_live_state(shm):
+    # the block is big enough and was written with this layout
+    if shm.size < LIVE_STATE_DTYPE.itemsize:
+        return False
+    record = np.ndarray((), dtype=LIVE_STATE_DTYPE, buffer=shm.buf)
+    holds = record['magic'] == LIVE_STATE_MAGIC and record['version'] == LIVE_STATE_VERSION
+    del record
+    return bool(holds)
+
+
+def _attach(name):
+    # a reader must not unlink the block when it exits (the writer owns it)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # before python 3.13 every attachment is tracked: keep this one out
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+# =============================================================================
+# WRITER
+# =============================================================================
+
+class live_state_publisher():
+    '''
+    the one writer of a live state block
+    '''
+
+    def __init__(self, name=DEFAULT_NAME):
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=LIVE_STATE_DTYPE.itemsize)
+            fresh = True
+        except FileExistsError:
+            # left by a writer that did not close: take it over if it has this layout,
+            # otherwise (another size or version, or not a live state) replace it
+            self.shm = shared_memory.SharedMemory(name=name)
+            fresh = not _holds_live_state(self.shm)
+            if fresh:
+                self.shm.close()
+                self.shm.unlink()
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=LIVE_STATE_DTYPE.itemsize)
+
+        self.name = name
+        self.record = np.ndarray((), dtype=LIVE_STATE_DTYPE, buffer=self.shm.buf)
+        if fresh:
+            self.record[()] = np.zeros((), dtype=LIVE_STATE_DTYPE)
+        self.seq = int(self.record['seq']) & ~1
+        self.record['seq'] = self.seq
+        self.record['version'] = LIVE_STATE_VERSION
+        self.record['magic'] = LIVE_STATE_MAGIC
+
+
+    def publish(self, state):
+        '''
+        write a harmony_state (or anything with its chroma_values, current_binary
+        and current_kpdve)
+        '''
+
+        kpdve = state.current_kpdve
+        kp_mask = pt_keypattern.get_binary_KP(kpdve[0], kpdve[1])
+
+        self.record['seq'] = self.seq + 1
+        self.record['time'] = time.time()
+        self.record['chroma'] = state.chroma_values
+        self.record['notegroup'] = state.current_binary
+        self.record['kp_mask'] = kp_mask
+        self.record['kpdve'] = kpdve
+        self.seq += 2
+        self.record['seq'] = self.seq
+
+
+    def close(self, unlink=True):
+        del self.record
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+# =============================================================================
+# READERS
+# =============================================================================
+
+class live_state_reader():
+    '''
+    one of any number of readers of a live state block
+    '''
+
+    def __init__(self, name=DEFAULT_NAME, retries=100):
+        self.name = name
+        self.retries = retries
+        self.shm = _attach(name)
+        if not _holds_live_state(self.shm):
+            self.shm.close()
+            raise ValueError(f"shared memory {name} does not hold a live state (version {LIVE_STATE_VERSION})")
+
+        self.record = np.ndarray((), dtype=LIVE_STATE_DTYPE, buffer=self.shm.buf)
+        self.last_seq = None
+
+
+    def read(self, only_new=True):
+        '''
+        the latest consistent state
+
+        Returns
+        -------
+        live_state_snapshot, or None if nothing new has been published
+        (or the writer stayed mid-write through every retry)
+        '''
+
+        for _ in range(self.retries):
+            seq = int(self.record['seq'])
+            if seq & 1:
+                continue
+            if only_new and seq == self.last_seq:
+                return None
+
+            copied = self.record.copy()
+            if int(self.record['seq']) == seq:
+                self.last_seq = seq
+                return live_state_snapshot(copied) if seq > 0 else None
+
+        return None
+
+
+    def close(self):
+        del self.record
+        self.shm.close()
+
+
+def wait_for_reader(name=DEFAULT_NAME, timeout=10.0):
+    '''
+    a reader, once a writer has created the block
+    '''
+
+    start = time.perf_counter()
+    while True:
+        try:
+            return live_state_reader(name)
+        except (FileNotFoundError, ValueError):
+            if time.perf_counter() - start > timeout:
+                raise
+            time.sleep(0.05)
+
+
+# =============================================================================
+# VIEWER
+# =============================================================================
+
+def run_viewer(name=DEFAULT_NAME, max_fps=30):
+    '''
+    show a published live state in a window, until it is closed or interrupted
+    '''
+
+    import pt_live_graph
+
+    reader = wait_for_reader(name)
+    snapshot = None
+    while snapshot is None:
+        snapshot = reader.read()
+        time.sleep(0.01)
+
+    graph_window = pt_live_graph.live_harmony_graph(snapshot, max_fps=max_fps)
+
+    try:
+        while True:
+            snapshot = reader.read()
+            if snapshot is not None:
+                graph_window.update_window_for_state(snapshot)
+            graph_window.service()
+            time.sleep(graph_window.min_interval / 2)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+
+def start_viewer(name=DEFAULT_NAME, max_fps=30):
+    '''
+    run_viewer in a new process
+
+    Returns
+    -------
+    subprocess.Popen
+    '''
+    return subprocess.Popen([sys.executable, __file__, "--name", name, "--fps", str(max_fps)])
+
+
+# =============================================================================
+# FOR THE LIVE LOOPS
+# =============================================================================
+
+def open_display(display, current_state, name=DEFAULT_NAME):
+    '''
+    the display for a live loop: "window", a graph in this process, or "shm", a
+    publisher and a viewer process (then Tk and matplotlib are never loaded here)
+
+    Returns
+    -------
+    (graph_window, publisher, viewer), the unused ones None
+    '''
+
+    if display == "window":
+        import pt_live_graph
+        return pt_live_graph.live_harmony_graph(current_state), None, None
+    elif display == "shm":
+        publisher = live_state_publisher(name)
+        publisher.publish(current_state)
+        return None, publisher, start_viewer(name)
+
+    raise ValueError(f"unknown display: {display}")
+
+
+def close_display(publisher, viewer):
+    if viewer is not None:
+        viewer.terminate()
+    if publisher is not None:
+        publisher.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="show the live harmony state published by pt_live_audio or pt_live_MIDI")
+    parser.add_argument("--name", default=DEFAULT_NAME, help="the shared memory block")
+    parser.add_argument("--fps", type=int, default=30, help="most redraws per second")
+    args = parser.parse_args()
+
+    run_viewer(args.name, args.fps)
@@ -21,6 +21,10 @@ def circle_ext_note_for_KPDVE(kpdve):
     128
     '''
 
+    i = KPDVE_table_index(kpdve)
+    if i >= 0:
+        return _CIRCLE_KPDVE_NOTES_LIST[i][EXT_COL]
+
     return pt_keypattern.get_binary_KPDVE_note(np.array([kpdve[0], kpdve[1], kpdve[2], kpdve[3], kpdve[4]]))
 
 
@@ -39,6 +43,10 @@ def chrom_ext_note_for_KPDVE(kpdve):
     4
     '''
 
+    i = KPDVE_table_index(kpdve)
+    if i >= 0:
+        return _CHROM_KPDVE_NOTES_LIST[i][EXT_COL]
+
     return pt_utils.f_circle_to_c_chrom(circle_ext_note_for_KPDVE(kpdve))
 
 
@@ -57,6 +65,10 @@ def circle_root_note_for_KPDVE(kpdve):
     1
     '''
 
+    i = KPDVE_table_index(kpdve)
+    if i >= 0:
+        return _CIRCLE_KPDVE_NOTES_LIST[i][ROOT_COL]
+
     return pt_keypattern.get_binary_KPDVE_note(np.array([kpdve[0], kpdve[1], kpdve[2], 0, 0]))
 
 
@@ -75,6 +87,10 @@ def chrom_root_note_for_KPDVE(kpdve):
     2
     '''
 
+    i = KPDVE_table_index(kpdve)
+    if i >= 0:
+        return _CHROM_KPDVE_NOTES_LIST[i][ROOT_COL]
+
     return pt_utils.f_circle_to_c_chrom(circle_root_note_for_KPDVE(kpdve))
 
 
@@ -93,6 +109,10 @@ def circle_conv_lyd_center_for_KPDVE(kpdve):
     2048
     '''
 
+    i = KPDVE_table_index(kpdve)
+    if i >= 0:
+        return _CIRCLE_KPDVE_NOTES_LIST[i][LYD_CENTER_COL]
+
     return circle_conv_tonic_for_KPDVE(np.array([kpdve[0], 0, 0, 0, 0]))
 
 
@@ -111,6 +131,10 @@ def circle_conv_tonic_for_KPDVE(kpdve):
     2048
     '''
 
+    i = KPDVE_table_index(kpdve)
+    if i >= 0:
+        return _CIRCLE_KPDVE_NOTES_LIST[i][TONIC_COL]
+
     return circle_root_note_for_KPDVE(np.array([kpdve[0], kpdve[1], pt_utils.CONVENTION_DIST[kpdve[1]], 0, 0]))
 
 
@@ -129,6 +153,10 @@ def chrom_conv_tonic_for_KPDVE(kpdve):
     2
     '''
 
+    i = KPDVE_table_index(kpdve)
+    if i >= 0:
+        return _CHROM_KPDVE_NOTES_LIST[i][TONIC_COL]
+
     return pt_utils.f_circle_to_c_chrom(circle_conv_tonic_for_KPDVE(kpdve))
 
 
@@ -366,6 +394,189 @@ def scale_conv_degree_for_KPDVE(kpdve):
     return (circle_conv_function_for_KPDVE(kpdve) * kpdve[3]) % 7
 
 
+
+# =============================================================================
+# FORWARD TABLE: EVERY KPDVE VALUE -> ITS CHORD AND DERIVED NOTES
+# =============================================================================
+# rows are indexed by the 16-bit encoding (pt_utils.KPDVE_to_binary_encoding);
+# encodings that are not a KPDVE value (e.g. MODVALS) hold zeros.
+# The notes are single bits: the same values the scalar functions above return.
+
+CHORD_COL = 0       # get_binary_KPDVE_chord
+ROOT_COL = 1        # circle_root_note_for_KPDVE
+TONIC_COL = 2       # circle_conv_tonic_for_KPDVE
+LYD_CENTER_COL = 3  # circle_conv_lyd_center_for_KPDVE
+EXT_COL = 4         # circle_ext_note_for_KPDVE
+
+
+def build_KPDVE_note_table():
+    '''
+    compute the chord, root, conventional tonic, lydian center and extension
+    for all 12 * 7^4 KPDVE values (circle-of-fifths)
+
+    Every value is a rotation (by K) of the same value in K = 0, and a chord is
+    the union of its notes up to E.
+
+    Returns
+    -------
+    np.array(65536, 5) (int)
+        columns CHORD_COL, ROOT_COL, TONIC_COL, LYD_CENTER_COL, EXT_COL
+    '''
+
+    # notes in K = 0, indexed [p, d, v, e]
+    notes = np.array([[[[pt_keypattern.get_binary_KPDVE_note(np.array([0, p, d, v, e]))
+                         for e in range(7)] for v in range(7)] for d in range(7)] for p in range(7)])
+    chords = np.bitwise_or.accumulate(notes, axis=3)
+
+    p, d, v, e = np.meshgrid(*[np.arange(7)] * 4, indexing='ij')
+    conv_d = pt_utils.CONVENTION_DIST[p]
+    k0_values = np.stack([chords,
+                          notes[p, d, 0, 0],
+                          notes[p, conv_d, 0, 0],
+                          np.full_like(p, notes[0, pt_utils.CONVENTION_DIST[0], 0, 0]),
+                          notes], axis=-1).reshape(-1, 5)
+
+    kpdve_a = np.zeros((12, 7 ** 4, 5), dtype=int)
+    kpdve_a[:, :, 0] = np.arange(12)[:, np.newaxis]
+    kpdve_a[:, :, 1:] = np.stack([p, d, v, e], axis=-1).reshape(-1, 4)
+
+    table = np.zeros((1 << 16, 5), dtype=int)
+    table[pt_utils.KPDVE_to_binary_encoding_array(kpdve_a)] = pt_utils.ROTATIONS_RIGHT[np.arange(12)[:, np.newaxis, np.newaxis], k0_values]
+
+    return table
+
+
+CIRCLE_KPDVE_NOTES = build_KPDVE_note_table()
+CHROM_KPDVE_NOTES = pt_utils.F_CIRCLE_TO_C_CHROM[CIRCLE_KPDVE_NOTES]
+CIRCLE_KPDVE_NOTES.flags.writeable = False
+CHROM_KPDVE_NOTES.flags.writeable = False
+
+# python lists for the scalar accessors (faster than indexing numpy one value at a time)
+_CIRCLE_KPDVE_NOTES_LIST = CIRCLE_KPDVE_NOTES.tolist()
+_CHROM_KPDVE_NOTES_LIST = CHROM_KPDVE_NOTES.tolist()
+
+
+def KPDVE_table_index(kpdve):
+    '''
+    the row of a KPDVE value in the forward table, or -1 when it is out of range
+    
+    >>> KPDVE_table_index(np.array([0,0,0,4,3]))
+    35
+    
+    >>> KPDVE_table_index(pt_utils.MODVALS)
+    -1
+    '''
+
+    k, p, d, v, e = (int(x) for x in kpdve)
+    if 0 <= k < 12 and 0 <= p < 7 and 0 <= d < 7 and 0 <= v < 7 and 0 <= e < 7:
+        return (k << 12) | (p << 9) | (d << 6) | (v << 3) | e
+
+    return -1
+
+
+def KPDVE_notes_array(kpdve_a, col, chromatic=False):
+    '''
+    read one column of the forward table for a whole analysis
+
+    Parameters
+    ----------
+    kpdve_a : np.array(n, 5)
+        kpdve values
+    col : int
+        CHORD_COL, ROOT_COL, TONIC_COL, LYD_CENTER_COL or EXT_COL
+    chromatic : bool
+        chromatic (True) or circle-of-fifths (False) notegroups
+
+    Returns
+    -------
+    np.array(n) (int)
+        binary notegroups (0 for values outside the KPDVE space)
+
+    F_M7, Bb M7 roots
+    >>> KPDVE_notes_array(np.array([[0,0,0,4,3], [11,0,0,4,3]]), ROOT_COL)
+    array([2048,    1])
+
+    >>> KPDVE_notes_array(np.array([[0,0,0,4,3], [12,7,7,7,7]]), CHORD_COL, chromatic=True)
+    array([2244,    0])
+    '''
+
+    kpdve_a = np.asarray(kpdve_a, dtype=int).reshape(-1, 5)
+    valid = ((kpdve_a >= 0) & (kpdve_a < np.array([12, 7, 7, 7, 7]))).all(axis=1)
+    index = np.where(valid, pt_utils.KPDVE_to_binary_encoding_array(np.where(valid[:, np.newaxis], kpdve_a, 0)), 
+                     pt_utils.KPDVE_to_binary_encoding(pt_utils.MODVALS))
+
+    table = CHROM_KPDVE_NOTES if chromatic else CIRCLE_KPDVE_NOTES
+    return table[index, col]
+
+
+
+# =============================================================================
+# INVERTED INDEX: CHROMATIC NOTEGROUP -> EVERY KPDVE THAT VOICES IT EXACTLY
+# =============================================================================
+# CSR layout: the encodings whose chord is notegroup n are
+# VOICING_ENCODINGS[VOICING_OFFSETS[n]:VOICING_OFFSETS[n + 1]], in ascending order.
+
+def build_KPDVE_voicing_index():
+    '''
+    group every KPDVE encoding under its (chromatic) chord
+
+    Returns
+    -------
+    offsets : np.array(4097) (int)
+    encodings : np.array(28812) (uint16)
+    '''
+
+    chords = CHROM_KPDVE_NOTES[:, CHORD_COL]
+    encodings = np.flatnonzero(chords)
+    encodings = encodings[np.argsort(chords[encodings], kind='stable')]
+
+    offsets = np.zeros(pt_utils.CHROMATIC_SCALE + 2, dtype=int)
+    offsets[1:] = np.cumsum(np.bincount(chords[encodings], minlength=pt_utils.CHROMATIC_SCALE + 1))
+
+    return offsets, encodings.astype(np.uint16)
+
+
+VOICING_OFFSETS, VOICING_ENCODINGS = build_KPDVE_voicing_index()
+VOICING_OFFSETS.flags.writeable = False
+VOICING_ENCODINGS.flags.writeable = False
+
+
+def KPDVE_encodings_for_chord(notegroup):
+    '''
+    the 16-bit encodings of every KPDVE whose chord is exactly notegroup (chromatic)
+
+    F Major 7
+    >>> len(KPDVE_encodings_for_chord(0b100011000100))
+    16
+
+    C Major triad
+    >>> KPDVE_encodings_for_chord(0b100010010000)[:4]
+    array([ 98, 154, 610, 666], dtype=uint16)
+    '''
+
+    notegroup = int(notegroup)
+    if not 0 <= notegroup <= pt_utils.CHROMATIC_SCALE:
+        return VOICING_ENCODINGS[:0]
+
+    return VOICING_ENCODINGS[VOICING_OFFSETS[notegroup]:VOICING_OFFSETS[notegroup + 1]]
+
+
+def KPDVE_voices_chord(kpdve, notegroup):
+    '''
+    True if the chord of kpdve is exactly notegroup (chromatic), in one lookup
+
+    >>> KPDVE_voices_chord(np.array([0,0,0,4,3]), 0b100011000100)
+    True
+
+    >>> KPDVE_voices_chord(np.array([0,0,0,4,2]), 0b100011000100)
+    False
+    '''
+
+    i = KPDVE_table_index(kpdve)
+
+    return i >= 0 and _CHROM_KPDVE_NOTES_LIST[i][CHORD_COL] == notegroup
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Opt-in timing of pipeline stages: wall time, CPU time, frames and the
+largest array each stage produced.
+
+    timing = pt_stagetiming.stage_report()
+    with timing.stage("chroma_stft") as s:
+        chroma_a = librosa.feature.chroma_stft(y=y, sr=sr)
+        s.add(chroma_a, frames=chroma_a.shape[1])
+    print(timing)
+
+Code that takes a report uses NO_TIMING when none is given: its stages are
+one shared object that does nothing, so an uninstrumented run pays only the
+calls to it.
+"""
+
+import time
+
+
+class stage_report():
+    '''
+    the stages of one or more runs, in the order they finished
+    '''
+
+    def __init__(self):
+        self.stages = []
+
+
+    def stage(self, name, frames=None):
+        '''
+        a context manager that times its block as a stage called name
+        '''
+        return _timed_stage(self, name, frames)
+
+
+    def totals(self):
+        '''
+        stages with the same name added together (e.g. over a batch of files)
+
+        Returns
+        -------
+        dict
+            name -> {calls, wall_s, cpu_s, frames, peak_bytes}
+        '''
+
+        totals = {}
+        for s in self.stages:
+            t = totals.setdefault(s["name"], {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "frames": 0, "peak_bytes": 0})
+            t["calls"] += 1
+            t["wall_s"] += s["wall_s"]
+            t["cpu_s"] += s["cpu_s"]
+            t["frames"] += s["frames"] or 0
+            t["peak_bytes"] = max(t["peak_bytes"], s["peak_bytes"])
+
+        return totals
+
+
+    def as_dict(self):
+        return {"stages": list(self.stages),
+                "wall_s": sum(s["wall_s"] for s in self.stages),
+                "cpu_s": sum(s["cpu_s"] for s in self.stages)}
+
+
+    def __str__(self):
+        lines = [f"{'stage':16} {'calls':>5} {'wall s':>9} {'cpu s':>9} {'frames':>10} {'peak MB':>9}"]
+        for name, t in self.totals().items():
+            lines.append(f"{name:16} {t['calls']:5d} {t['wall_s']:9.3f} {t['cpu_s']:9.3f} {t['frames']:10d} {t['peak_bytes'] / 1e6:9.1f}")
+
+        return "\n".join(lines)
+
+
+class _timed_stage():
+    __slots__ = ('report', 'name', 'frames', 'peak_bytes', 'peak_shape', 'wall', 'cpu')
+
+    def __init__(self, report, name, frames=None):
+        self.report = report
+        self.name = name
+        self.frames = frames
+        self.peak_bytes = 0
+        self.peak_shape = None
+
+
+    def add(self, *arrays, frames=None):
+        '''
+        note the arrays the stage produced (the largest is kept) and/or its frame count
+        '''
+
+        for a in arrays:
+            nbytes = getattr(a, "nbytes", 0)
+            if nbytes > self.peak_bytes:
+                self.peak_bytes = nbytes
+                self.peak_shape = tuple(a.shape)
+        if frames is not None:
+            self.frames = int(frames)
+
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+
+    def __exit__(self, exc_type, exc, tb):
+        self.report.stages.append({"name": self.name,
+                                   "wall_s": time.perf_counter() - self.wall,
+                                   "cpu_s": time.process_time() - self.cpu,
+                                   "frames": self.frames,
+                                   "peak_bytes": self.peak_bytes,
+                                   "peak_shape": self.peak_shape})
+        return False
+
+
+# =============================================================================
+# DISABLED
+# =============================================================================
+
+class _null_stage():
+    __slots__ = ()
+
+    def add(self, *arrays, frames=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class _null_report():
+    __slots__ = ()
+
+    def stage(self, name, frames=None):
+        return _NULL_STAGE
+
+
+_NULL_STAGE = _null_stage()
+NO_TIMING = _null_report()
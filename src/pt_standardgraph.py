@@ -36,14 +36,25 @@ def heatmap_col_mask_for_kpdve_bin(a_kpdve, ng):
     return full_column, mask
 
 def data_and_mask_for_kpdve_a_bin_a_heatmap(kpdve_a, bin_a):
-    heatmap = []
-    mask = []
-    for k, b in zip(kpdve_a, bin_a):
-        col, msk = heatmap_col_mask_for_kpdve_bin(k, b)
-        heatmap.append(np.flipud(col))
-        mask.append(np.flipud(msk))
+    kpdve_a = np.asarray(kpdve_a, dtype=int).reshape(-1, 5)
+    bin_a = np.asarray(bin_a, dtype=int).reshape(-1)
 
-    return np.array(heatmap).T, np.array(mask).T
+    # k, p, d rows: the first bit of each note, read from the forward table
+    kpd_notes = np.column_stack([pt_musicutils.KPDVE_notes_array(kpdve_a, col) 
+                                 for col in (pt_musicutils.LYD_CENTER_COL, pt_musicutils.TONIC_COL, pt_musicutils.ROOT_COL)])
+    kpd_part = np.argmax(pt_utils.NOTEGROUP_BITS[kpd_notes], axis=2) % 12
+
+    bin_notes = pt_utils.notegroup_bits_array(pt_utils.c_chrom_to_f_circle_array(bin_a))
+    spacer = np.ones((len(bin_a), 2), dtype=int)
+
+    heatmap = np.hstack([kpd_part, spacer, bin_notes * np.arange(12)])
+    mask = np.hstack([np.zeros_like(kpd_part), spacer, 1 - bin_notes])
+
+    # values outside the table (no analysis) go through the scalar functions
+    for i in np.flatnonzero((kpd_notes == 0).any(axis=1)):
+        heatmap[i], mask[i] = heatmap_col_mask_for_kpdve_bin(kpdve_a[i], bin_a[i])
+
+    return np.fliplr(heatmap).T, np.fliplr(mask).T
 
 def bin_a_kpdve_a_heatmap(bin_a, kpdve_a, title=None):
     data, mask = data_and_mask_for_kpdve_a_bin_a_heatmap(kpdve_a, bin_a)
@@ -82,7 +93,7 @@ def notegroup_heatmap(notegroup, chromatic=False, title=None):
 
 
 def multiple_notegroup_heatmap(notegroup_list, chromatic=False, yticks=[], title=None):
-    np_notegroup_list = np.array([pt_utils.binary_notegroup_to_numpy_array(ng) for ng in notegroup_list])
+    np_notegroup_list = pt_utils.notegroup_bits_array(notegroup_list)
     np_notegroup_list_clr = numpy_matrix_by_circleindex(np_notegroup_list)
     
     fig, ax = plt.subplots(figsize=(6, len(np_notegroup_list)/2.0))
@@ -113,7 +124,7 @@ def multiple_notegroup_heatmap(notegroup_list, chromatic=False, yticks=[], title
 
 
 def horizontal_notegroup_heatmap(notegroup_list, chromatic=False, xticks=[], title=None):
-    np_notegroup_list = np.array([pt_utils.binary_notegroup_to_numpy_array(ng) for ng in notegroup_list])
+    np_notegroup_list = pt_utils.notegroup_bits_array(notegroup_list)
     np_notegroup_list_clr = numpy_matrix_by_circleindex(np_notegroup_list)
 
     # flip it horizontal
@@ -169,7 +180,7 @@ def multiple_kpdve_heatmap(kpdve_list, yticks=[], title=None):
     # get the binary values corresponding to the kpdve list
     states = [harmony_state.harmony_state(kpdve) for kpdve in kpdve_list]
     notegroup_list = np.array([pt_utils.c_chrom_to_f_circle(a_state.current_binary) for a_state in states])
-    np_notegroup_list = np.array([pt_utils.binary_notegroup_to_numpy_array(ng) for ng in notegroup_list])
+    np_notegroup_list = pt_utils.notegroup_bits_array(notegroup_list)
     np_notegroup_list_clr = numpy_matrix_by_circleindex(np_notegroup_list)
     
     # make a mask
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The greedy step of harmony_state.change_notegroup as a lookup table:
+(notegroup, previous KPDVE) -> next KPDVE
+
+K is a rotation: turning a notegroup by a fifth turns every candidate K by one
+and leaves P, D, V, E and all distances alone. So the table is built with the
+previous K at 0, and a row holds every previous P, D, V, E (7^4 = 2401 columns)
+for each of the 4096 (circle-based) notegroups: 4096 x 2401 uint16 values,
+about 20 MB per v_opt and weight set, written once and then memory-mapped.
+
+Build from the command line (weights: K P D V E, default CURRENT_WEIGHTS):
+    python pt_transitiontable.py --v_opt 0 --directory . --weights 1 1 1 1 1
+"""
+
+import os
+import argparse
+import numpy as np
+
+import pt_utils
+import pt_keypattern
+import pt_kpdve_list_optimize
+import partita
+
+# entries that are not an encoded KPDVE (valid encodings stay below 0xC000)
+INVALID_ENTRY = 0xFFFF  # no analysis for the notegroup: the state does not change
+SEARCH_ENTRY = 0xFFFE   # equally close candidates in different keys: their order depends on the real K, so search
+
+PDVE_COUNT = 7 ** 4
+
+
+class transition_table():
+    '''
+    a (memory-mapped) table of greedy steps for one v_opt and weight set
+    '''
+
+    def __init__(self, table, v_opt=0, weights=None):
+        self.table = table
+        self.v_opt = v_opt
+        self.weights = pt_kpdve_list_optimize.CURRENT_WEIGHTS if weights is None else weights
+
+
+    def next_kpdve(self, notegroup, kpdve):
+        '''
+        the result of partita.analyze_binary_input_for_closest_KPDVE, read from the table
+
+        Parameters
+        ----------
+        notegroup : int
+            a chromatic pitch class set
+        kpdve : np.array(5)
+            the previous kpdve result
+
+        Returns
+        -------
+        np.array(5) (int)
+            the closest KPDVE analysis (pt_utils.MODVALS if there is none)
+
+        '''
+
+        k, p, d, v, e = (int(x) for x in kpdve)
+
+        if (0 <= notegroup <= pt_utils.CHROMATIC_SCALE
+                and 0 <= k < 12 and 0 <= p < 7 and 0 <= d < 7 and 0 <= v < 7 and 0 <= e < 7):
+            ng_rel = pt_utils.rotate_bits_left(pt_utils.c_chrom_to_f_circle(notegroup), k)
+            entry = int(self.table[ng_rel, ((p * 7 + d) * 7 + v) * 7 + e])
+
+            if entry == INVALID_ENTRY:
+                return np.copy(pt_utils.MODVALS)
+
+            if entry != SEARCH_ENTRY:
+                result = pt_utils.binary_encoding_to_KPDVE(entry)
+                result[0] = (result[0] + k) % 12
+                return result
+
+        return partita.analyze_binary_input_for_closest_KPDVE(notegroup, kpdve, v_opt=self.v_opt, weights=self.weights)
+
+
+    def next_encoding(self, notegroup, enc_kpdve):
+        '''
+        next_kpdve on 16-bit encodings (pt_utils.KPDVE_to_binary_encoding):
+        ints in and out, no arrays unless the table says to search
+
+        Returns
+        -------
+        int
+            the encoded closest KPDVE (pt_utils.MODVALS_ENCODING if there is none)
+
+        '''
+
+        column = _PDVE_COLUMNS[enc_kpdve & 0xFFF]
+        k = enc_kpdve >> 12
+
+        if 0 <= notegroup <= pt_utils.CHROMATIC_SCALE and k < 12 and column >= 0:
+            ng_rel = pt_utils.rotate_bits_left(pt_utils.c_chrom_to_f_circle(notegroup), k)
+            entry = int(self.table[ng_rel, column])
+
+            if entry == INVALID_ENTRY:
+                return pt_utils.MODVALS_ENCODING
+
+            if entry != SEARCH_ENTRY:
+                return ((((entry >> 12) + k) % 12) << 12) | (entry & 0xFFF)
+
+        kpdve = pt_utils.binary_encoding_to_KPDVE(enc_kpdve)
+        return int(pt_utils.KPDVE_to_binary_encoding(self.next_kpdve(notegroup, kpdve)))
+
+
+# the table column for the low 12 bits (PPPDDDVVVEEE) of an encoding, -1 if a value is 7
+_PDVE_COLUMNS = [((p * 7 + d) * 7 + v) * 7 + e if max(p, d, v, e) < 7 else -1
+                 for p in range(8) for d in range(8) for v in range(8) for e in range(8)]
+
+
+# =============================================================================
+# BUILD AND LOAD
+# =============================================================================
+
+def build_transition_array(v_opt=0, weights=None):
+    '''
+    enumerate the greedy step for every circle-based notegroup and every
+    previous (0, P, D, V, E)
+
+    Parameters
+    ----------
+    v_opt : int (index)
+        selects from voicing options in keypattern.py.
+    weights : np.array(5), optional
+        distance weights. The default is pt_kpdve_list_optimize.CURRENT_WEIGHTS.
+
+    Returns
+    -------
+    np.array(4096, 2401) (uint16)
+        encoded KPDVE (K relative to the previous K), INVALID_ENTRY or SEARCH_ENTRY
+
+    '''
+
+    if weights is None:
+        weights = pt_kpdve_list_optimize.CURRENT_WEIGHTS
+
+    offsets, data = pt_keypattern.KPDVE_candidate_table(v_opt)
+
+    landmarks = np.zeros((PDVE_COUNT, 5), dtype=int)
+    landmarks[:, 1:] = np.array(np.unravel_index(np.arange(PDVE_COUNT), (7, 7, 7, 7))).T
+
+    table = np.full((pt_utils.CHROMATIC_SCALE + 1, PDVE_COUNT), INVALID_ENTRY, dtype=np.uint16)
+
+    # circle notegroup 0 is chromatic 0: no analysis (see partita.analyze_binary_note_input)
+    for ng in range(1, pt_utils.CHROMATIC_SCALE + 1):
+        candidates = data[offsets[ng]:offsets[ng + 1]].astype(int)
+        if np.array_equal(candidates[0], pt_utils.MODVALS):
+            continue
+
+        distances = pt_kpdve_list_optimize.weighted_kpdve_distances(candidates[np.newaxis, :, :],
+                                                                     landmarks[:, np.newaxis, :],
+                                                                     weights)
+        # same preference as closest_kpdve: the landmark's key (K = 0) first
+        k_match = candidates[:, 0] == 0
+        if k_match.any():
+            distances = np.where(k_match, distances, np.inf)
+
+        best = np.argmin(distances, axis=1)
+        best_k = candidates[best, 0]
+
+        ties = distances == distances[np.arange(PDVE_COUNT), best][:, np.newaxis]
+        ambiguous = (ties & (candidates[:, 0] != best_k[:, np.newaxis])).any(axis=1)
+
+        encoded = pt_utils.KPDVE_to_binary_encoding_array(candidates)
+        table[ng] = np.where(ambiguous, SEARCH_ENTRY, encoded[best])
+
+    return table
+
+
+def transition_table_filename(v_opt=0, weights=None, directory="."):
+    '''
+    the file for a v_opt and weight set, e.g. ./pt_transitions_v0_w1.3_1.2_1.1_1_0.9.npy
+    '''
+
+    if weights is None:
+        weights = pt_kpdve_list_optimize.CURRENT_WEIGHTS
+
+    weight_string = "_".join(f"{w:g}" for w in weights)
+    return os.path.join(directory, f"pt_transitions_v{v_opt % len(pt_keypattern.v_options)}_w{weight_string}.npy")
+
+
+def save_transition_table(v_opt=0, weights=None, directory="."):
+    '''
+    build the table and write it to disk (see transition_table_filename)
+
+    Returns
+    -------
+    str
+        the path written
+
+    '''
+
+    filename = transition_table_filename(v_opt, weights, directory)
+    np.save(filename, build_transition_array(v_opt, weights))
+
+    return filename
+
+
+def load_transition_table(v_opt=0, weights=None, directory="."):
+    '''
+    memory-map a saved table for use with harmony_state(transitions=...)
+
+    Returns
+    -------
+    transition_table
+
+    '''
+
+    filename = transition_table_filename(v_opt, weights, directory)
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"{filename} not found: build it with 'python pt_transitiontable.py --v_opt {v_opt}'")
+
+    return transition_table(np.load(filename, mmap_mode='r'), v_opt=v_opt, weights=weights)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="build the (notegroup, KPDVE) -> KPDVE transition table")
+    parser.add_argument("--v_opt", type=int, default=0)
+    parser.add_argument("--directory", default=".")
+    parser.add_argument("--weights", type=float, nargs=5, default=None, metavar=("K", "P", "D", "V", "E"),
+                        help="distance weights (default: pt_kpdve_list_optimize.CURRENT_WEIGHTS)")
+    args = parser.parse_args()
+
+    weights = None if args.weights is None else np.array(args.weights)
+    print(save_transition_table(args.v_opt, weights, directory=args.directory))
@@ -97,8 +97,18 @@ def c_chrom_to_f_circle(notegroup):
     FM 7
     >>> c_chrom_to_f_circle(0b100010010001)
     1632
+
+    arrays too
+    >>> c_chrom_to_f_circle(np.array([0b101011010101, 0b100010010001]))
+    array([4064, 1632])
     '''
 
+    if isinstance(notegroup, np.ndarray):
+        if _table_notegroups(notegroup):
+            return c_chrom_to_f_circle_array(notegroup)
+    elif 0 <= notegroup <= CHROMATIC_SCALE:
+        return _C_CHROM_TO_F_CIRCLE_LIST[notegroup]
+
     return rotate_bits_right(chrom_circle_switch(notegroup), 1)
 
 
@@ -123,6 +133,12 @@ def f_circle_to_c_chrom(notegroup):
     2244
 
     '''
+    if isinstance(notegroup, np.ndarray):
+        if _table_notegroups(notegroup):
+            return f_circle_to_c_chrom_array(notegroup)
+    elif 0 <= notegroup <= CHROMATIC_SCALE:
+        return _F_CIRCLE_TO_C_CHROM_LIST[notegroup]
+
     return chrom_circle_switch(rotate_bits_left(notegroup, 1))
 
 
@@ -206,6 +222,12 @@ def rotate_bits_right(notegroup, shiftcount):
 
     '''
 
+    if isinstance(notegroup, np.ndarray):
+        if _table_notegroups(notegroup):
+            return rotate_bits_right_array(notegroup, shiftcount)
+    elif 0 <= notegroup <= CHROMATIC_SCALE:
+        return _ROTATIONS_RIGHT_LIST[shiftcount % 12][notegroup]
+
     netshift = shiftcount % 12
     if netshift == 0:
         return notegroup
@@ -233,6 +255,12 @@ def rotate_bits_left(notegroup, shiftcount):
     3847
     '''
 
+    if isinstance(notegroup, np.ndarray):
+        if _table_notegroups(notegroup):
+            return rotate_bits_left_array(notegroup, shiftcount)
+    elif 0 <= notegroup <= CHROMATIC_SCALE:
+        return _ROTATIONS_RIGHT_LIST[-shiftcount % 12][notegroup]
+
     netshift = shiftcount % 12
     if netshift == 0:
         return notegroup
@@ -264,12 +292,8 @@ def bit_locs(notegroup):
     array([ 6,  7, 10, 11])
     '''
 
-    locs = []
-    for i in range(12):
-        if LEFT_BIT & notegroup == LEFT_BIT:
-            locs.append(i)
-        notegroup <<= 1
-    return np.array(locs)
+    # only the rightmost twelve bits are ever read
+    return _BIT_LOCS[notegroup & CHROMATIC_SCALE].copy()
 
 
 def bit_count(notegroup):
@@ -296,12 +320,8 @@ def bit_count(notegroup):
     0
     '''
 
-    notes = 0
-    for i in range(12):
-        if LEFT_BIT & notegroup == LEFT_BIT:
-            notes = notes + 1
-        notegroup <<= 1
-    return notes
+    # only the rightmost twelve bits are ever read
+    return _BIT_COUNT_LIST[notegroup & CHROMATIC_SCALE]
 
 
 def single_bit_loc(notegroup):
@@ -423,15 +443,38 @@ def  KPDVE_to_binary_encoding(aKPDVE):
 
     '''
 
-    encodedByte = np.int(0);
+    encodedByte = 0;
     
     for an_int in aKPDVE:
         encodedByte = encodedByte << 3
-        encodedByte = np.int(an_int) | encodedByte
+        encodedByte = int(an_int) | encodedByte
     
     return encodedByte;    
 
 
+def KPDVE_to_binary_encoding_array(kpdve_a):
+    '''
+    KPDVE_to_binary_encoding for a whole array of kpdve values
+
+    Parameters
+    ----------
+    kpdve_a : np.array(n, 5)
+
+    Returns
+    -------
+    np.array(n) (int)
+        16-bit encoded kpdve numbers
+
+    >>> KPDVE_to_binary_encoding_array(np.array([[0,0,0,4,3], [11,0,2,4,3]]))
+    array([   35, 45219])
+    '''
+
+    kpdve_a = np.asarray(kpdve_a, dtype=int)
+
+    return ((kpdve_a[..., 0] << 12) | (kpdve_a[..., 1] << 9) | (kpdve_a[..., 2] << 6)
+            | (kpdve_a[..., 3] << 3) | kpdve_a[..., 4])
+
+
 def binary_encoding_to_KPDVE(enc_kpdve):
     '''
 
@@ -451,13 +494,36 @@ def binary_encoding_to_KPDVE(enc_kpdve):
     '''
     result = np.zeros(5, dtype=int)
     for i in range(4):
-        result[4 - i] = np.int(enc_kpdve & 0b111)
+        result[4 - i] = int(enc_kpdve & 0b111)
         enc_kpdve >>= 3;
     result[0] = enc_kpdve;
 
     return result
 
 
+def binary_encoding_to_KPDVE_array(enc_a):
+    '''
+    binary_encoding_to_KPDVE for a whole array of encodings
+
+    Parameters
+    ----------
+    enc_a : np.array(n)
+        16-bit kpdve encodings
+
+    Returns
+    -------
+    np.array(n, 5) (int)
+
+    >>> binary_encoding_to_KPDVE_array(np.array([35, 45219]))
+    array([[ 0,  0,  0,  4,  3],
+           [11,  0,  2,  4,  3]])
+    '''
+
+    enc_a = np.asarray(enc_a, dtype=int).reshape(-1)
+
+    return (enc_a[:, np.newaxis] >> np.array([12, 9, 6, 3, 0])) & np.array([0b1111, 0b111, 0b111, 0b111, 0b111])
+
+
 def minimal_bin_kpdve(notegroup, kpdve):
     '''
     returns a uint32 for notes and harmony
@@ -530,6 +596,86 @@ def binary_encoded_context_chord_pair(context, chord):
     return (context << 12) | chord
 
 
+# bit positions of K, P, D, V, E in a musical pixel (the notegroup takes the low 12)
+PIXEL_SHIFTS = np.array([24, 21, 18, 15, 12], dtype=np.uint32)
+PIXEL_MASKS = np.array([0b1111, 0b111, 0b111, 0b111, 0b111], dtype=np.uint32)
+
+# the unpacked fields of a musical pixel, one record per frame
+PIXEL_DTYPE = np.dtype([('k', np.uint8), ('p', np.uint8), ('d', np.uint8),
+                        ('v', np.uint8), ('e', np.uint8), ('notegroup', np.uint16)])
+
+
+def minimal_bin_kpdve_array(notegroups, kpdve_a):
+    '''
+    minimal_bin_kpdve for a whole analysis
+
+    Parameters
+    ----------
+    notegroups : np.array(n) or np.array(n, 1)
+        binary notegroups (chromatic)
+    kpdve_a : np.array(n, 5)
+        kpdve encodings
+
+    Returns
+    -------
+    np.array(n) (uint32)
+        musical pixels: KKKKPPPDDDVVVEEEC-D-EF-G-A-B
+
+    >>> minimal_bin_kpdve_array(np.array([2244, 1]), np.array([[0,0,0,4,3], [11,0,2,4,3]]))
+    array([   145604, 185217025], dtype=uint32)
+    '''
+
+    kpdve_a = np.asarray(kpdve_a).astype(np.uint32).reshape(-1, 5)
+    notegroups = np.asarray(notegroups).astype(np.uint32).reshape(len(kpdve_a))
+
+    return np.bitwise_or.reduce(kpdve_a << PIXEL_SHIFTS, axis=1) | notegroups
+
+
+def bin_kpdve_from_minimal_array(packed_a):
+    '''
+    bin_kpdve_from_minimal for a whole analysis
+
+    Parameters
+    ----------
+    packed_a : np.array(n)
+        musical pixels
+
+    Returns
+    -------
+    np.array(n) (int), np.array(n, 5) (int)
+        notegroups and kpdve values
+
+    >>> bin_kpdve_from_minimal_array(np.array([145604, 185217025]))
+    (array([2244,    1]), array([[ 0,  0,  0,  4,  3],
+           [11,  0,  2,  4,  3]]))
+    '''
+
+    packed_a = np.asarray(packed_a).astype(np.uint32).reshape(-1)
+    kpdve_a = (packed_a[:, np.newaxis] >> PIXEL_SHIFTS) & PIXEL_MASKS
+
+    return (packed_a & CHROMATIC_SCALE).astype(int), kpdve_a.astype(int)
+
+
+def pixel_fields(packed_a):
+    '''
+    unpack musical pixels into a structured array with fields
+    k, p, d, v, e and notegroup (see PIXEL_DTYPE)
+
+    >>> fields = pixel_fields(np.array([145604, 185217025]))
+    >>> fields['k'], fields['notegroup']
+    (array([ 0, 11], dtype=uint8), array([2244,    1], dtype=uint16))
+    '''
+
+    packed_a = np.asarray(packed_a).astype(np.uint32).reshape(-1)
+
+    fields = np.empty(len(packed_a), dtype=PIXEL_DTYPE)
+    for name, shift, mask in zip(PIXEL_DTYPE.names, PIXEL_SHIFTS, PIXEL_MASKS):
+        fields[name] = (packed_a >> shift) & mask
+    fields['notegroup'] = packed_a & CHROMATIC_SCALE
+
+    return fields
+
+
 def numpy_array_to_binary_notegroup(numpy_pclassset):
     '''
     take a 12 int numpy arrat of pitch class sets, return as int.
@@ -559,6 +705,70 @@ def numpy_array_to_binary_notegroup(numpy_pclassset):
     return notegroup
 
 
+# the value of each of the twelve chroma rows as a bit: C = 2048 ... B = 1
+BIT_WEIGHTS = LEFT_BIT >> np.arange(12)
+
+
+def top_n_mask(chroma_a, max_notes):
+    '''
+    True for the max_notes strongest values in each column (frame) of a chroma
+    array; ties at the cut are broken arbitrarily (np.argpartition)
+
+    >>> top_n_mask(np.array([0.1, 0.9, 0.5, 0.7]), 2)
+    array([False,  True, False,  True])
+    '''
+
+    chroma_a = np.asarray(chroma_a)
+    if max_notes >= chroma_a.shape[0]:
+        return np.ones(chroma_a.shape, dtype=bool)
+
+    mask = np.zeros(chroma_a.shape, dtype=bool)
+    if max_notes <= 0:
+        return mask
+
+    top = np.argpartition(chroma_a, -max_notes, axis=0)[-max_notes:]
+    np.put_along_axis(mask, top, True, axis=0)
+
+    return mask
+
+
+def chroma_to_binary_array(chroma_a, threshold=0.5, max_notes=None):
+    '''
+    reduce chroma to chromatic notegroups: a bit for every value above threshold
+    (and, with max_notes, among the strongest max_notes of its frame)
+
+    Parameters
+    ----------
+    chroma_a : np.array(12, n) or np.array(12)
+        chroma frames (columns), C first
+    threshold : float
+        the intensity beyond which a chroma gets marked as a 'yes'
+    max_notes : int, optional
+        keep at most this many notes per frame (see top_n_mask)
+
+    Returns
+    -------
+    np.array(n) (int), or an int for a single frame
+
+    >>> chroma_to_binary_array(np.array([[0, 1], [0, 0], [0, 0], [0, 0], [0, 0], [2, 1], 
+    ...                                  [0, 0], [0, 0], [0, 0], [0, 0], [0, 0], [0, 1]]))
+    array([  64, 2113])
+
+    >>> chroma_to_binary_array(np.array([0.6, 0, 0, 0, 0.9, 0, 0, 0.8, 0, 0, 0, 0]), max_notes=2)
+    144
+    '''
+
+    chroma_a = np.asarray(chroma_a)
+    active = chroma_a > threshold
+    if max_notes is not None:
+        active &= top_n_mask(chroma_a, max_notes)
+
+    if active.ndim == 1:
+        return int(BIT_WEIGHTS @ active)
+
+    return BIT_WEIGHTS @ active
+
+
 def binary_notegroup_to_numpy_array(notegroup):
     '''
     take a 12 int numpy array of pitch class sets, return as int.
@@ -579,14 +789,88 @@ def binary_notegroup_to_numpy_array(notegroup):
 
     '''
 
-    np_array = np.zeros(12, dtype=int)
+    return NOTEGROUP_BITS[notegroup & CHROMATIC_SCALE].copy()
+
+
+# =============================================================================
+# ragged (CSR) arrays: row i is data[offsets[i]:offsets[i+1]]
+# =============================================================================
+
+def ragged_take(offsets, data, rows):
+    '''
+    gather rows from a ragged (offsets, data) pair into a new ragged pair, 
+    without a python loop over the rows
+
+    Parameters
+    ----------
+    offsets : np.array(m + 1) (int)
+        start of each row in data, with the total length at the end
+    data : np.array(offsets[-1], ...)
+        the concatenated rows
+    rows : np.array(n) (int)
+        the rows to take, in order (repeats allowed)
+
+    Returns
+    -------
+    (np.array(n + 1), np.array(total, ...))
+        offsets and data for the selected rows
+
+    >>> ragged_take(np.array([0, 2, 3, 6]), np.arange(6), np.array([2, 0, 0]))
+    (array([0, 3, 5, 7]), array([3, 4, 5, 0, 1, 0, 1]))
+    '''
+
+    rows = np.asarray(rows, dtype=int)
+    starts = offsets[rows]
+    counts = offsets[rows + 1] - starts
+
+    new_offsets = np.zeros(rows.shape[0] + 1, dtype=int)
+    np.cumsum(counts, out=new_offsets[1:])
+
+    # for each output position: its row's start in data, plus its place in the row
+    take_idx = np.repeat(starts - new_offsets[:-1], counts) + np.arange(new_offsets[-1])
+
+    return new_offsets, data[take_idx]
+
+
+def run_length_encode(values, lengths=None):
+    '''
+    collapse runs of equal neighbours
+
+    Parameters
+    ----------
+    values : np.array(n)
+        e.g. a notegroup per frame
+    lengths : np.array(n) (int), optional
+        how many frames each value stands for (0 drops it). The default is 1 each.
+
+    Returns
+    -------
+    (starts, lengths, values) : np.array(r) x 3
+        the first frame, frame count and value of each run;
+        np.repeat(values, lengths) restores the frames
+
+    >>> run_length_encode(np.array([5, 5, 0, 5, 5, 5]))
+    (array([0, 2, 3]), array([2, 1, 3]), array([5, 0, 5]))
+
+    >>> run_length_encode(np.array([5, 5, 0, 7]), np.array([2, 1, 0, 4]))
+    (array([0, 3]), array([3, 4]), array([5, 7]))
+    '''
+
+    values = np.asarray(values)
+    if lengths is None:
+        lengths = np.ones(values.shape[0], dtype=int)
+    else:
+        lengths = np.asarray(lengths, dtype=int)
+        values, lengths = values[lengths > 0], lengths[lengths > 0]
+
+    if values.shape[0] == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), values
 
-    for i in range(12):
-        if (notegroup & LEFT_BIT) > 0:
-            np_array[i] = 1
-        notegroup <<= 1
+    run_index = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    run_lengths = np.add.reduceat(lengths, run_index)
+    starts = np.concatenate(([0], np.cumsum(run_lengths)[:-1]))
 
-    return np_array
+    return starts, run_lengths, values[run_index]
 
 
 def numpy_chrom_to_circle(a_chroma):
@@ -599,6 +883,115 @@ def numpy_circle_to_chrom(circle_a):
     return np.array([chrom_a[(i*7)%12] for i in range(12)])
 
 
+# =============================================================================
+# LOOKUP TABLES: every 12-bit notegroup, computed once with the bit operations
+# above. The scalar functions read python lists (fast for single ints, and 
+# they return ints); the _array functions below index the numpy tables.
+# =============================================================================
+
+_NOTEGROUPS = np.arange(CHROMATIC_SCALE + 1)
+
+# ROTATIONS_RIGHT[s, ng] == rotate_bits_right(ng, s)
+ROTATIONS_RIGHT = np.array([rightmost_twelve((_NOTEGROUPS >> s) | (_NOTEGROUPS << (12 - s))) for s in range(12)])
+C_CHROM_TO_F_CIRCLE = ROTATIONS_RIGHT[1, chrom_circle_switch(_NOTEGROUPS)]
+F_CIRCLE_TO_C_CHROM = chrom_circle_switch(ROTATIONS_RIGHT[11, _NOTEGROUPS])
+
+# NOTEGROUP_BITS[ng] == binary_notegroup_to_numpy_array(ng)
+NOTEGROUP_BITS = (_NOTEGROUPS[:, np.newaxis] >> np.arange(11, -1, -1)) & 1
+BIT_COUNTS = NOTEGROUP_BITS.sum(axis=1)
+
+# KPDVE_DECODE[enc] == binary_encoding_to_KPDVE(enc), for every 16-bit encoding
+KPDVE_DECODE = binary_encoding_to_KPDVE_array(np.arange(1 << 16))
+MODVALS_ENCODING = int(KPDVE_to_binary_encoding(MODVALS))
+
+for _table in (ROTATIONS_RIGHT, C_CHROM_TO_F_CIRCLE, F_CIRCLE_TO_C_CHROM, NOTEGROUP_BITS, BIT_COUNTS, KPDVE_DECODE):
+    _table.flags.writeable = False
+
+_ROTATIONS_RIGHT_LIST = ROTATIONS_RIGHT.tolist()
+_C_CHROM_TO_F_CIRCLE_LIST = C_CHROM_TO_F_CIRCLE.tolist()
+_F_CIRCLE_TO_C_CHROM_LIST = F_CIRCLE_TO_C_CHROM.tolist()
+_BIT_COUNT_LIST = BIT_COUNTS.tolist()
+# (an empty notegroup has always given an empty float array)
+_BIT_LOCS = [np.flatnonzero(bits) if bits.any() else np.array([]) for bits in NOTEGROUP_BITS]
+
+
+def _table_notegroups(notegroups):
+    # an integer array within 0-4095: the _array variants apply (otherwise the bit ops do)
+    return (np.issubdtype(notegroups.dtype, np.integer)
+            and (notegroups.size == 0 or (notegroups.min() >= 0 and notegroups.max() <= CHROMATIC_SCALE)))
+
+
+def c_chrom_to_f_circle_array(notegroups):
+    '''
+    c_chrom_to_f_circle for an array of notegroups (0-4095)
+
+    >>> c_chrom_to_f_circle_array(np.array([0b101011010101, 0b100010010001]))
+    array([4064, 1632])
+    '''
+
+    return C_CHROM_TO_F_CIRCLE[notegroups]
+
+
+def f_circle_to_c_chrom_array(notegroups):
+    '''
+    f_circle_to_c_chrom for an array of notegroups (0-4095)
+
+    >>> f_circle_to_c_chrom_array(np.array([0b110011000000]))
+    array([2244])
+    '''
+
+    return F_CIRCLE_TO_C_CHROM[notegroups]
+
+
+def rotate_bits_right_array(notegroups, shiftcount):
+    '''
+    rotate_bits_right for an array of notegroups (0-4095). shiftcount may be 
+    a single int or an array of the same shape.
+
+    >>> rotate_bits_right_array(np.array([0b111111100000, 0b111111100000]), np.array([3, 0]))
+    array([ 508, 4064])
+    '''
+
+    return ROTATIONS_RIGHT[np.asarray(shiftcount) % 12, notegroups]
+
+
+def rotate_bits_left_array(notegroups, shiftcount):
+    '''
+    rotate_bits_left for an array of notegroups (0-4095). shiftcount may be 
+    a single int or an array of the same shape.
+
+    >>> rotate_bits_left_array(np.array([0b111111100000]), 3)
+    array([3847])
+    '''
+
+    return ROTATIONS_RIGHT[-np.asarray(shiftcount) % 12, notegroups]
+
+
+def bit_count_array(notegroups):
+    '''
+    bit_count for an array of notegroups
+
+    >>> bit_count_array(np.array([0b10, 0b110011000000, 0]))
+    array([1, 4, 0])
+    '''
+
+    return BIT_COUNTS[np.asarray(notegroups) & CHROMATIC_SCALE]
+
+
+def notegroup_bits_array(notegroups):
+    '''
+    binary_notegroup_to_numpy_array for an array of notegroups: one row of 
+    twelve 0/1 values per notegroup (the array form of bit_locs)
+
+    >>> notegroup_bits_array(np.array([0b111000111000, 0b1]))
+    array([[1, 1, 1, 0, 0, 0, 1, 1, 1, 0, 0, 0],
+           [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1]])
+    '''
+
+    return NOTEGROUP_BITS[np.asarray(notegroups) & CHROMATIC_SCALE]
+
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
\ No newline at end of file